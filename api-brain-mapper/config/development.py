@@ -28,4 +28,68 @@ class DevelopmentConfig(object):
     CSRF_TOKEN_TIMEOUT = 3600  # 1 hour in seconds
     CSRF_SECRET_KEY = os.getenv(
         'SECRET_KEY', 'dev-secret-key-change-in-production'
-    )
\ No newline at end of file
+    )
+    # Tokens with a verified signature remembered per worker, and whether
+    # tokens signed before HMAC-SHA256 are still accepted. Only enable it for
+    # the deploy upgrading from them: even then they are only accepted during
+    # CSRF_TOKEN_TIMEOUT after the worker started, and the setting can be
+    # removed afterwards
+    CSRF_VERIFIED_CACHE_SIZE = int(os.getenv('CSRF_VERIFIED_CACHE_SIZE', 10000))
+    CSRF_ACCEPT_LEGACY_TOKENS = (
+        os.getenv('CSRF_ACCEPT_LEGACY_TOKENS', 'false').lower() == 'true'
+    )
+
+    # Batch inference settings
+    INFERENCE_BATCH_MAX_IMAGES = int(os.getenv('INFERENCE_BATCH_MAX_IMAGES', 50))
+    INFERENCE_BATCH_CONCURRENCY = int(
+        os.getenv('INFERENCE_BATCH_CONCURRENCY', 8)
+    )  # Simultaneous NN API calls per batch request
+
+    # Seconds an inference waits for an identical one already in flight
+    INFERENCE_SINGLE_FLIGHT_TIMEOUT = int(
+        os.getenv('INFERENCE_SINGLE_FLIGHT_TIMEOUT', 120)
+    )
+
+    # Redirect inference images to presigned MinIO URLs instead of
+    # streaming them through the API
+    INFERENCE_IMAGE_REDIRECT = (
+        os.getenv('INFERENCE_IMAGE_REDIRECT', 'false').lower() == 'true'
+    )
+
+    # Local cache of inference images: memory LRU of small images per
+    # worker, plus a disk LRU shared by the workers (disabled if no dir)
+    IMAGE_CACHE_MEMORY_BYTES = int(
+        os.getenv('IMAGE_CACHE_MEMORY_BYTES', 32 * 1024 * 1024)
+    )
+    IMAGE_CACHE_MEMORY_ITEM_BYTES = int(
+        os.getenv('IMAGE_CACHE_MEMORY_ITEM_BYTES', 256 * 1024)
+    )
+    IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR')
+    IMAGE_CACHE_DISK_BYTES = int(
+        os.getenv('IMAGE_CACHE_DISK_BYTES', 1024 * 1024 * 1024)
+    )
+
+    # Thumbnail widths served with ?w=, and "width:format" thumbnails
+    # generated along with every inference
+    INFERENCE_THUMBNAIL_WIDTHS = os.getenv(
+        'INFERENCE_THUMBNAIL_WIDTHS', '160,320,640,1280'
+    )
+    INFERENCE_THUMBNAIL_PREGENERATE = os.getenv(
+        'INFERENCE_THUMBNAIL_PREGENERATE', '320:webp'
+    )
+
+    # Bulk export (POST /inferences/export)
+    INFERENCE_EXPORT_MAX_INFERENCES = int(
+        os.getenv('INFERENCE_EXPORT_MAX_INFERENCES', 500)
+    )
+    INFERENCE_EXPORT_PREFETCH = int(
+        os.getenv('INFERENCE_EXPORT_PREFETCH', 4)
+    )  # MinIO objects downloaded concurrently ahead of the ZIP writer
+
+    # Bulk deletion (DELETE /inferences)
+    INFERENCE_DELETE_MAX_IDS = int(os.getenv('INFERENCE_DELETE_MAX_IDS', 1000))
+
+    # Seconds the id, role, name and email of an authenticated user are
+    # cached by each worker, and users cached per worker
+    AUTH_USER_CACHE_TTL = int(os.getenv('AUTH_USER_CACHE_TTL', 30))
+    AUTH_USER_CACHE_SIZE = int(os.getenv('AUTH_USER_CACHE_SIZE', 10000))
\ No newline at end of file
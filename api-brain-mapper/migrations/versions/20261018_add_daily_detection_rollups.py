@@ -0,0 +1,62 @@
+"""Add daily rollup tables for time-series metrics
+
+Revision ID: add_daily_detection_rollups
+Revises: add_detections
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_daily_detection_rollups'
+down_revision = 'add_detections'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Primary keys start with (userId, day) so a date range is one index scan
+    op.create_table('daily_inference_counts',
+        sa.Column('userId', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('modelId', sa.Integer(), nullable=False),
+        sa.Column('inferenceCount', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('totalDetections', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('userId', 'day', 'modelId'),
+        sa.ForeignKeyConstraint(['userId'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['modelId'], ['models.id'])
+    )
+
+    op.create_table('daily_detection_counts',
+        sa.Column('userId', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('modelId', sa.Integer(), nullable=False),
+        sa.Column('classId', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False, server_default='0'),
+        sa.PrimaryKeyConstraint('userId', 'day', 'modelId', 'classId'),
+        sa.ForeignKeyConstraint(['userId'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['modelId'], ['models.id'])
+    )
+
+    # Seed the rollups with the inferences already summarized
+    op.execute("""
+        INSERT INTO daily_inference_counts ("userId", day, "modelId", "inferenceCount", "totalDetections")
+        SELECT "userId", CAST("createdOn" AS DATE), "modelId", COUNT(*), SUM("totalDetections")
+        FROM inferences
+        WHERE "totalDetections" IS NOT NULL
+        GROUP BY "userId", CAST("createdOn" AS DATE), "modelId";
+    """)
+    op.execute("""
+        INSERT INTO daily_detection_counts ("userId", day, "modelId", "classId", count)
+        SELECT i."userId", CAST(i."createdOn" AS DATE), i."modelId", c."classId", SUM(c.count)
+        FROM inference_class_counts c
+        JOIN inferences i ON i.id = c."inferenceId"
+        GROUP BY i."userId", CAST(i."createdOn" AS DATE), i."modelId", c."classId";
+    """)
+
+
+def downgrade():
+    op.drop_table('daily_detection_counts')
+    op.drop_table('daily_inference_counts')
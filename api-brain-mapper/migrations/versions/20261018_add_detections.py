@@ -0,0 +1,43 @@
+"""Add detections table with one row per detection
+
+Revision ID: add_detections
+Revises: add_inference_detection_summary
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_detections'
+down_revision = 'add_inference_detection_summary'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('detections',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('inferenceId', sa.Integer(), nullable=False),
+        sa.Column('userId', sa.Integer(), nullable=False),
+        sa.Column('modelId', sa.Integer(), nullable=False),
+        sa.Column('createdOn', sa.DateTime(), nullable=False),
+        sa.Column('classId', sa.Integer(), nullable=False),
+        sa.Column('confidence', sa.Float(), nullable=True),
+        sa.Column('bboxX1', sa.Float(), nullable=True),
+        sa.Column('bboxY1', sa.Float(), nullable=True),
+        sa.Column('bboxX2', sa.Float(), nullable=True),
+        sa.Column('bboxY2', sa.Float(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.ForeignKeyConstraint(['inferenceId'], ['inferences.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['userId'], ['users.id']),
+        sa.ForeignKeyConstraint(['modelId'], ['models.id']),
+        sa.Index('idx_detections_user_class_created', 'userId', 'classId', 'createdOn'),
+        sa.Index('idx_detections_user_created', 'userId', 'createdOn'),  # For date range exports
+        sa.Index('idx_detections_inference', 'inferenceId')  # For the FK cascade and per-inference reads
+    )
+
+
+def downgrade():
+    op.drop_table('detections')
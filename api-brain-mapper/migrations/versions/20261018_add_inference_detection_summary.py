@@ -0,0 +1,49 @@
+"""Add detection summary to inferences
+
+Revision ID: add_inference_detection_summary
+Revises: remove_static_model_data
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_inference_detection_summary'
+down_revision = 'remove_static_model_data'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Summary columns (NULL for inferences not summarized yet)
+    op.add_column('inferences',
+                  sa.Column('totalDetections', sa.Integer(), nullable=True))
+    op.add_column('inferences',
+                  sa.Column('meanConfidence', sa.Float(), nullable=True))
+    op.add_column('inferences',
+                  sa.Column('minConfidence', sa.Float(), nullable=True))
+    op.add_column('inferences',
+                  sa.Column('maxConfidence', sa.Float(), nullable=True))
+
+    # For the metrics queries filtering by user and date
+    op.create_index('idx_inferences_user_created', 'inferences',
+                    ['userId', 'createdOn'])
+
+    op.create_table('inference_class_counts',
+        sa.Column('inferenceId', sa.Integer(), nullable=False),
+        sa.Column('classId', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('inferenceId', 'classId'),
+        sa.ForeignKeyConstraint(['inferenceId'], ['inferences.id'], ondelete='CASCADE')
+    )
+
+
+def downgrade():
+    op.drop_table('inference_class_counts')
+    op.drop_index('idx_inferences_user_created', table_name='inferences')
+    op.drop_column('inferences', 'maxConfidence')
+    op.drop_column('inferences', 'minConfidence')
+    op.drop_column('inferences', 'meanConfidence')
+    op.drop_column('inferences', 'totalDetections')
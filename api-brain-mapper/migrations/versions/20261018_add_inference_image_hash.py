@@ -0,0 +1,28 @@
+"""Add image hash to inferences for the results cache
+
+Revision ID: add_inference_image_hash
+Revises: add_inference_jobs
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_inference_image_hash'
+down_revision = 'add_inference_jobs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('inferences',
+                  sa.Column('imageHash', sa.String(64), nullable=True))
+    op.create_index('idx_inferences_user_image_hash', 'inferences',
+                    ['userId', 'imageHash', 'modelId'])
+
+
+def downgrade():
+    op.drop_index('idx_inferences_user_image_hash', table_name='inferences')
+    op.drop_column('inferences', 'imageHash')
@@ -0,0 +1,28 @@
+"""Add lease heartbeat and claim token to inference jobs
+
+Revision ID: add_inference_job_lease
+Revises: add_inference_tombstones
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_inference_job_lease'
+down_revision = 'add_inference_tombstones'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('inference_jobs',
+                  sa.Column('heartbeatOn', sa.DateTime(), nullable=True))
+    op.add_column('inference_jobs',
+                  sa.Column('claimToken', sa.String(32), nullable=True))
+
+
+def downgrade():
+    op.drop_column('inference_jobs', 'claimToken')
+    op.drop_column('inference_jobs', 'heartbeatOn')
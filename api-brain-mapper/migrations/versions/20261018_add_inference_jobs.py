@@ -0,0 +1,46 @@
+"""Add inference jobs queue
+
+Revision ID: add_inference_jobs
+Revises: add_daily_detection_rollups
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_inference_jobs'
+down_revision = 'add_daily_detection_rollups'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('inference_jobs',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('userId', sa.Integer(), nullable=False),
+        sa.Column('modelId', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(60), nullable=False),
+        sa.Column('folderName', sa.String(32), nullable=False),
+        sa.Column('status', sa.String(20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('errorMessage', sa.String(500), nullable=True),
+        sa.Column('inferenceId', sa.Integer(), nullable=True),
+        sa.Column('createdOn', sa.DateTime(), nullable=False),
+        sa.Column('startedOn', sa.DateTime(), nullable=True),
+        sa.Column('finishedOn', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.ForeignKeyConstraint(['userId'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['modelId'], ['models.id']),
+        sa.ForeignKeyConstraint(['inferenceId'], ['inferences.id'], ondelete='SET NULL'),
+        sa.Index('idx_inference_jobs_user', 'userId')
+    )
+
+    # Workers only scan pending jobs, finished ones stay out of the index
+    op.create_index('idx_inference_jobs_pending', 'inference_jobs', ['id'],
+                    postgresql_where=sa.text("status IN ('queued', 'running')"))
+
+
+def downgrade():
+    op.drop_table('inference_jobs')
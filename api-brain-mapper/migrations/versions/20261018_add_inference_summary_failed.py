@@ -0,0 +1,26 @@
+"""Flag inferences whose metadata could not be summarized
+
+Revision ID: add_inference_summary_failed
+Revises: add_inference_job_lease
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_inference_summary_failed'
+down_revision = 'add_inference_job_lease'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('inferences',
+                  sa.Column('summaryFailed', sa.Boolean(), nullable=False,
+                            server_default=sa.false()))
+
+
+def downgrade():
+    op.drop_column('inferences', 'summaryFailed')
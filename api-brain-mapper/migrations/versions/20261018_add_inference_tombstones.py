@@ -0,0 +1,39 @@
+"""Add tombstones of deleted inferences for the storage reaper
+
+Revision ID: add_inference_tombstones
+Revises: add_inference_image_hash
+Create Date: 2026-10-18
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'add_inference_tombstones'
+down_revision = 'add_inference_image_hash'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('inference_tombstones',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('userId', sa.Integer(), nullable=False),
+        sa.Column('inferenceId', sa.Integer(), nullable=False),
+        sa.Column('prefix', sa.String(200), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('errorMessage', sa.String(500), nullable=True),
+        sa.Column('createdOn', sa.DateTime(), nullable=False),
+        sa.Column('nextAttemptOn', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+    # The reaper only scans tombstones still to be retried
+    op.create_index('idx_inference_tombstones_pending', 'inference_tombstones',
+                    ['nextAttemptOn'],
+                    postgresql_where=sa.text('"nextAttemptOn" IS NOT NULL'))
+
+
+def downgrade():
+    op.drop_table('inference_tombstones')
@@ -19,6 +19,12 @@ from .models.user import User
 from .models.role import Role
 from .models.model import Model
 from .models.inference import Inference
+from .models.inference_class_count import InferenceClassCount
+from .models.detection import Detection
+from .models.daily_detection_count import DailyDetectionCount
+from .models.daily_inference_count import DailyInferenceCount
+from .models.inference_job import InferenceJob
+from .models.inference_tombstone import InferenceTombstone
 from .models.dataset import Dataset
 from .models.model_dataset import ModelDataset
 from .models.audit_log import AuditLog
@@ -34,6 +40,11 @@ from .routes.users import users
 from .routes.admin import admin
 from .routes.metrics import metrics
 
+# Import CLI commands
+from .services.metadata_backfill import backfill_detections_command
+from .services.inference_jobs import inference_worker_command
+from .services.storage_reaper import storage_reaper_command
+
 migrate = Migrate()  # Creates an instance of migrate without initialization
 
 
@@ -91,6 +102,11 @@ def create_app():
     app.register_blueprint(admin)
     app.register_blueprint(metrics)
 
+    # Register CLI commands
+    app.cli.add_command(backfill_detections_command)
+    app.cli.add_command(inference_worker_command)
+    app.cli.add_command(storage_reaper_command)
+
     # Setup cors policies
     app.config["CORS_EXPOSE_HEADERS"] = ["Content-Type"]
     app.config["CORS_SUPPORTS_CREDENTIALS"] = True
@@ -1,20 +1,164 @@
 import os
+import time
+import socket
+import threading
+import certifi
+import urllib3
 from dotenv import load_dotenv
 from minio import Minio
 from urllib.parse import urlparse
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import EmptyPoolError
 load_dotenv()
 
+# Every getMinioClient() call of a process shares this client and its pool
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+class _PoolStatsMixin:
+    """
+    Counts how often requests had to wait for a free connection.
+    The MinIO client never passes a pool timeout, so with MINIO_POOL_BLOCK a
+    request waits at most MINIO_POOL_TIMEOUT seconds for a free connection
+    and then fails with EmptyPoolError, instead of hanging while the pool is
+    exhausted.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool_timeout = float(os.getenv("MINIO_POOL_TIMEOUT", 10))
+        self.stats_lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.saturated_waits = 0
+        self.pool_timeouts = 0
+        self.wait_seconds = 0.0
+
+    def _get_conn(self, timeout=None):
+        saturated = self.pool is not None and self.pool.empty()
+        started_at = time.monotonic()
+        try:
+            conn = super()._get_conn(self.pool_timeout if timeout is None else timeout)
+        except EmptyPoolError:
+            with self.stats_lock:
+                self.saturated_waits += 1
+                self.pool_timeouts += 1
+                self.wait_seconds += time.monotonic() - started_at
+            raise
+        with self.stats_lock:
+            if saturated:
+                self.saturated_waits += 1
+                self.wait_seconds += time.monotonic() - started_at
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+        return conn
+
+    def _put_conn(self, conn):
+        with self.stats_lock:
+            self.in_use = max(0, self.in_use - 1)
+        super()._put_conn(conn)
+
+
+class _StatsHTTPConnectionPool(_PoolStatsMixin, HTTPConnectionPool):
+    pass
+
+
+class _StatsHTTPSConnectionPool(_PoolStatsMixin, HTTPSConnectionPool):
+    pass
+
+
+def _createHttpClient(secure):
+    """
+    Connection pool of the MinIO client. Under gevent a worker serves many
+    requests at once, so MINIO_POOL_MAXSIZE keep-alive connections are
+    kept per host. When all of them are in use, e.g. held by slow clients
+    of streamed images, a request opens an extra connection that is closed
+    afterwards. MINIO_POOL_BLOCK=true caps the connections instead: requests
+    wait up to MINIO_POOL_TIMEOUT seconds for a free one, so the pool must
+    then be sized for the streams, exports and copies in flight per worker.
+    """
+    timeout = urllib3.Timeout(
+        connect=float(os.getenv("MINIO_CONNECT_TIMEOUT", 5)),
+        read=float(os.getenv("MINIO_READ_TIMEOUT", 60)),
+    )
+    http_client = urllib3.PoolManager(
+        timeout=timeout,
+        maxsize=int(os.getenv("MINIO_POOL_MAXSIZE", 32)),
+        block=os.getenv("MINIO_POOL_BLOCK", "false").lower() == "true",
+        # TCP keep-alive so idle pooled connections dropped by a proxy or
+        # NAT are detected instead of failing the next request
+        socket_options=HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+        ],
+        cert_reqs="CERT_REQUIRED" if secure else "CERT_NONE",
+        ca_certs=os.environ.get("SSL_CERT_FILE") or certifi.where(),
+        retries=urllib3.Retry(
+            total=int(os.getenv("MINIO_MAX_RETRIES", 3)),
+            backoff_factor=0.2,
+            status_forcelist=[500, 502, 503, 504],
+        ),
+    )
+    http_client.pool_classes_by_scheme = {
+        "http": _StatsHTTPConnectionPool,
+        "https": _StatsHTTPSConnectionPool,
+    }
+    return http_client
+
 
 def getMinioClient():
-    s3LiveBaseUrl = os.getenv('S3_LIVE_BASE_URL').rstrip('/')  # Assuming the URL is in the format 'https://example.com/bucket'
-    parsed_base = urlparse(s3LiveBaseUrl)  # Parse the URL to get only the host and port
-    host = parsed_base.hostname
-    port = parsed_base.port if parsed_base.port else (443 if parsed_base.scheme == 'https' else 80)  # Make sure there's a port otherwise set defaults
-    access_key = os.getenv('S3_ACCESS_KEY')
-    secret_key = os.getenv('S3_SECRET_KEY')
-    return Minio(
-        endpoint=f"{host}:{port}",
-        access_key=access_key,
-        secret_key=secret_key,
-        secure=(os.getenv('ENV_MODE') == "production"),
-    )
\ No newline at end of file
+    """
+    Get the MinIO client of this process, creating it on first use.
+    A new one is created after a fork so workers never share sockets.
+    """
+    global _client, _client_pid
+
+    with _client_lock:
+        if _client is None or _client_pid != os.getpid():
+            s3LiveBaseUrl = os.getenv('S3_LIVE_BASE_URL').rstrip('/')  # Assuming the URL is in the format 'https://example.com/bucket'
+            parsed_base = urlparse(s3LiveBaseUrl)  # Parse the URL to get only the host and port
+            host = parsed_base.hostname
+            port = parsed_base.port if parsed_base.port else (443 if parsed_base.scheme == 'https' else 80)  # Make sure there's a port otherwise set defaults
+            access_key = os.getenv('S3_ACCESS_KEY')
+            secret_key = os.getenv('S3_SECRET_KEY')
+            secure = os.getenv('ENV_MODE') == "production"
+            _client = Minio(
+                endpoint=f"{host}:{port}",
+                access_key=access_key,
+                secret_key=secret_key,
+                secure=secure,
+                http_client=_createHttpClient(secure),
+            )
+            _client_pid = os.getpid()
+        return _client
+
+
+def getMinioPoolStats():
+    """Connection pool usage of this process' MinIO client, per host"""
+    with _client_lock:
+        client = _client if _client_pid == os.getpid() else None
+    if client is None:
+        return {"pid": os.getpid(), "pools": []}
+
+    pools = []
+    http_client = client._http
+    for key in list(http_client.pools.keys()):
+        pool = http_client.pools.get(key)
+        if pool is None or pool.pool is None:
+            continue
+        with pool.stats_lock:
+            pools.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "maxSize": pool.pool.maxsize,
+                "inUse": pool.in_use,
+                "peakInUse": pool.peak_in_use,
+                "idle": sum(1 for conn in list(pool.pool.queue) if conn is not None),
+                "connectionsOpened": pool.num_connections,
+                "requests": pool.num_requests,
+                "saturatedWaits": pool.saturated_waits,
+                "poolTimeouts": pool.pool_timeouts,
+                "waitSeconds": round(pool.wait_seconds, 3),
+            })
+    return {"pid": os.getpid(), "pools": pools}
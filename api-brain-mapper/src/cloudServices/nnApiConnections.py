@@ -1,54 +1,442 @@
 from dotenv import load_dotenv
+import os
+import time
+import threading
 import requests
 import jwt
 import uuid
+import json
+import base64
 from datetime import datetime, timedelta, timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from logs.logger import logger
+from .nnApiGuards import (
+    NnApiOverloadedError,
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+)
 
 load_dotenv()
 
+# Every NnAPIClient of a process shares this session and its connection pool
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def getNnApiSession():
+    """
+    Get the keep-alive session of this process, creating it on first use.
+    A new one is created after a fork so workers never share sockets.
+    Only idempotent methods are retried on read errors and 502/503/504,
+    with jittered exponential backoff. Connection errors are retried for
+    every method since the request never reached the NN API.
+    Each replica keeps up to max(NN_API_POOL_MAXSIZE, NN_API_CONCURRENCY_MAX)
+    connections, so every call admitted by a concurrency limiter can reuse
+    one even if all of them go to the same replica. The pool doesn't block:
+    every client has its own limiter and calls outside of it (training,
+    probes) share the pool, so a call over the pool size opens a connection
+    that is closed afterwards instead of waiting without a timeout.
+    """
+    global _session, _session_pid
+
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            retries = Retry(
+                total=int(os.getenv("NN_API_MAX_RETRIES", 3)),
+                status_forcelist=(502, 503, 504),
+                allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+                backoff_factor=float(os.getenv("NN_API_RETRY_BACKOFF", 0.3)),
+                backoff_jitter=float(os.getenv("NN_API_RETRY_JITTER", 0.3)),
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(
+                pool_connections=16,  # Hosts with a pool kept, one per replica
+                pool_maxsize=max(
+                    int(os.getenv("NN_API_POOL_MAXSIZE", 10)),
+                    int(os.getenv("NN_API_CONCURRENCY_MAX", 64)),
+                ),
+                pool_block=False,
+                max_retries=retries,
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+            _session_pid = os.getpid()
+        return _session
+
+
+class NnApiReplica:
+    """
+    Load and health of one NN API replica.
+    A replica is ejected after EJECT_AFTER_FAILURES consecutive failures
+    (connection errors, timeouts or 5xx) and probed again once its ejection
+    expires. Each failed probe doubles the ejection, up to MAX_EJECT_SECONDS.
+    """
+    EWMA_ALPHA = 0.3
+    EJECT_AFTER_FAILURES = 3
+    EJECT_SECONDS = 5
+    MAX_EJECT_SECONDS = 120
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.in_flight = 0
+        self.ewma_latency = None
+        self.consecutive_failures = 0
+        self.ejected_until = None
+        self.eject_seconds = self.EJECT_SECONDS
+        self.probing = False
+
+    def isHealthy(self):
+        return self.ejected_until is None
+
+    def score(self, default_latency):
+        """
+        Expected wait of a new request, lower is better
+        :param default_latency: Used while the replica has no latency yet
+        """
+        latency = self.ewma_latency if self.ewma_latency is not None else default_latency
+        return (self.in_flight + 1) * latency
+
+    def recordSuccess(self, elapsed):
+        if self.ewma_latency is None:
+            self.ewma_latency = elapsed
+        else:
+            self.ewma_latency += self.EWMA_ALPHA * (elapsed - self.ewma_latency)
+        self.consecutive_failures = 0
+
+    def recordFailure(self, elapsed):
+        # Failing fast must not make the replica look faster than the others
+        self.ewma_latency = 2 * max(self.ewma_latency or 0.0, elapsed)
+        self.consecutive_failures += 1
+        if self.isHealthy() and self.consecutive_failures >= self.EJECT_AFTER_FAILURES:
+            self.eject()
+
+    def eject(self):
+        self.ejected_until = time.monotonic() + self.eject_seconds
+        logger.warning(
+            f"NN API replica {self.base_url} ejected for {self.eject_seconds}s"
+        )
+
+    def restore(self):
+        self.ejected_until = None
+        self.ewma_latency = None  # Measured again from its next requests
+        self.consecutive_failures = 0
+        self.eject_seconds = self.EJECT_SECONDS
+        logger.info(f"NN API replica {self.base_url} is healthy again")
+
+    def getStats(self):
+        return {
+            "baseUrl": self.base_url,
+            "healthy": self.isHealthy(),
+            "inFlight": self.in_flight,
+            "ewmaLatencySeconds": self.ewma_latency,
+            "consecutiveFailures": self.consecutive_failures,
+        }
+
 
 class NnAPIClient:
+    # The NN API tokens expire after TOKEN_LIFETIME seconds. They are reused
+    # until TOKEN_REFRESH_MARGIN seconds before, so retries still carry a
+    # valid token.
+    TOKEN_LIFETIME = 30
+    TOKEN_REFRESH_MARGIN = 10
+
     def __init__(self, base_url, secret_key):
         """
         Initialize the client that will communicate with NN API
         :param base_url: Base URL of API
-                        (eg: 'https://api.neuralnetwork.com/v1')
+                        (eg: 'https://api.neuralnetwork.com/v1'), or a comma
+                        separated list of replicas. Inferences are balanced
+                        across the replicas, the other calls go to the first.
         :param secret_key: Secret key for NN API
         """
-        self.base_url = base_url
+        if base_url is None or isinstance(base_url, str):
+            base_url = (base_url or "").split(",")
+        self.replicas = [
+            NnApiReplica(url.strip().rstrip("/")) for url in base_url if url.strip()
+        ]
+        self.base_url = self.replicas[0].base_url if self.replicas else None
+        self._replicas_lock = threading.Lock()
         self.secret_key = secret_key
+        self.timeout = (
+            float(os.getenv("NN_API_CONNECT_TIMEOUT", 5)),
+            float(os.getenv("NN_API_READ_TIMEOUT", 120)),
+        )
+
+        self._token = None
+        self._token_refresh_at = 0
+        self._token_lock = threading.Lock()
+
+        self._latency = {}
+        self._latency_lock = threading.Lock()
+
+        # Guards of the inference calls, so a slow or failing NN API
+        # rejects requests early instead of piling them up
+        self.limiter = AdaptiveConcurrencyLimiter()
+        self.breaker = CircuitBreaker()
+        self.limit_wait_timeout = float(os.getenv("NN_API_LIMIT_WAIT", 2))
 
     def _generateToken(self):
         jti = str(uuid.uuid4())
         now = datetime.now(timezone.utc)
 
-        payload = {"jti": jti, "iat": now, "exp": now + timedelta(seconds=30)}
+        payload = {
+            "jti": jti,
+            "iat": now,
+            "exp": now + timedelta(seconds=self.TOKEN_LIFETIME),
+        }
 
         token = jwt.encode(payload, self.secret_key, algorithm="HS256")
         return token
 
-    def generateInferenceWithBinary(
+    def _getToken(self):
+        """Get the current token, minting a new one close to its expiry"""
+        with self._token_lock:
+            now = time.monotonic()
+            if self._token is None or now >= self._token_refresh_at:
+                self._token = self._generateToken()
+                self._token_refresh_at = (
+                    now + self.TOKEN_LIFETIME - self.TOKEN_REFRESH_MARGIN
+                )
+            return self._token
+
+    def _request(self, name, method, path, headers=None, balanced=False, **kwargs):
+        """
+        Send a request to the NN API through the pooled session and record
+        its latency under the name of the client method.
+        :param balanced: Send it to the least loaded healthy replica instead
+                         of the first one, behind the concurrency limiter
+                         and the circuit breaker
+        Raises requests.HTTPError if the NN API does not answer 200, and
+        NnApiOverloadedError if a balanced request is rejected unsent.
+        """
+        headers = {"Authorization": f"Bearer {self._getToken()}", **(headers or {})}
+        breaker_generation = self._admitRequest() if balanced else None
+        replica = None
+        base_url = self.base_url
+
+        started_at = time.monotonic()
+        failed = True
+        server_failed = True
+        # Everything after the admission is inside the try, so the limiter
+        # slot and a half-open trial are always given back
+        try:
+            if balanced:
+                replica = self._acquireReplica()
+                base_url = replica.base_url
+            response = getNnApiSession().request(
+                method,
+                f"{base_url}{path}",
+                headers=headers,
+                timeout=self.timeout,
+                **kwargs,
+            )
+            server_failed = response.status_code >= 500
+            if response.status_code != 200:
+                response.raise_for_status()
+            failed = False
+            return response
+        finally:
+            elapsed = time.monotonic() - started_at
+            if replica:
+                self._releaseReplica(replica, elapsed, server_failed)
+            if balanced:
+                self.breaker.record(server_failed, breaker_generation)
+                # No replica: never sent, the limit isn't adapted
+                self.limiter.release(elapsed if replica else None, server_failed)
+            self._recordLatency(name, elapsed, failed)
+            logger.debug(f"NN API {name} on {base_url} took {elapsed * 1000:.0f}ms")
+
+    def _admitRequest(self):
+        """
+        Take a limiter slot and pass the circuit breaker, or raise
+        :return: The circuit breaker generation the request was admitted under
+        """
+        if not self.limiter.acquire(self.limit_wait_timeout):
+            raise NnApiOverloadedError("Too many NN API requests in flight", 1)
+        breaker_generation = self.breaker.allowRequest()
+        if breaker_generation is None:
+            self.limiter.release()
+            raise NnApiOverloadedError(
+                "NN API circuit breaker is open", self.breaker.getRetryAfter()
+            )
+        return breaker_generation
+
+    def getGuardStats(self):
+        """State of the concurrency limiter and the circuit breaker"""
+        return {
+            "concurrencyLimiter": self.limiter.getStats(),
+            "circuitBreaker": self.breaker.getStats(),
+        }
+
+    def _acquireReplica(self):
+        """
+        Pick the healthy replica with the lowest expected wait, given its
+        in-flight requests and EWMA latency. Ejected replicas whose ejection
+        expired are probed in the background. If every replica is ejected,
+        the one closest to being probed is used rather than failing.
+        """
+        with self._replicas_lock:
+            now = time.monotonic()
+            for replica in self.replicas:
+                if (not replica.isHealthy() and not replica.probing
+                        and now >= replica.ejected_until):
+                    replica.probing = True
+                    threading.Thread(
+                        target=self._probeReplica, args=(replica,), daemon=True
+                    ).start()
+
+            healthy = [replica for replica in self.replicas if replica.isHealthy()]
+            if healthy:
+                latencies = [r.ewma_latency for r in healthy if r.ewma_latency is not None]
+                default_latency = sum(latencies) / len(latencies) if latencies else 1.0
+                replica = min(healthy, key=lambda r: r.score(default_latency))
+            else:
+                replica = min(self.replicas, key=lambda r: r.ejected_until)
+            replica.in_flight += 1
+            return replica
+
+    def _releaseReplica(self, replica, elapsed, failed):
+        with self._replicas_lock:
+            replica.in_flight -= 1
+            if failed:
+                replica.recordFailure(elapsed)
+            else:
+                replica.recordSuccess(elapsed)
+
+    def _probeReplica(self, replica):
+        """Health check of an ejected replica, runs in its own thread"""
+        try:
+            response = getNnApiSession().get(
+                f"{replica.base_url}/models",
+                headers={"Authorization": f"Bearer {self._getToken()}"},
+                timeout=self.timeout[0],
+            )
+            healthy = response.status_code < 500
+        except requests.RequestException:
+            healthy = False
+
+        with self._replicas_lock:
+            replica.probing = False
+            if healthy:
+                replica.restore()
+            else:
+                replica.eject_seconds = min(
+                    replica.eject_seconds * 2, replica.MAX_EJECT_SECONDS
+                )
+                replica.eject()
+
+    def getReplicaStats(self):
+        """Load and health of every NN API replica"""
+        with self._replicas_lock:
+            return [replica.getStats() for replica in self.replicas]
+
+    def _recordLatency(self, name, elapsed, failed):
+        with self._latency_lock:
+            stats = self._latency.setdefault(
+                name, {"calls": 0, "errors": 0, "totalSeconds": 0.0, "maxSeconds": 0.0}
+            )
+            stats["calls"] += 1
+            stats["errors"] += int(failed)
+            stats["totalSeconds"] += elapsed
+            stats["maxSeconds"] = max(stats["maxSeconds"], elapsed)
+
+    def getLatencyStats(self):
+        """
+        Latency of the NN API calls made by this client, per method
+        :return: dict of method name to calls, errors, avg and max seconds
+        """
+        with self._latency_lock:
+            return {
+                name: {
+                    "calls": stats["calls"],
+                    "errors": stats["errors"],
+                    "avgSeconds": stats["totalSeconds"] / stats["calls"],
+                    "maxSeconds": stats["maxSeconds"],
+                }
+                for name, stats in self._latency.items()
+            }
+
+    def generateInferenceResult(
         self, image_data, model_name, original_filename="image.jpg"
     ):
         """
-        Generate inference using binary image data
+        Generate inference asking the NN API for a binary result.
+        NN API versions that support it answer multipart/mixed with the
+        metadata JSON part and the raw result image part. Older versions
+        ignore the Accept header and answer JSON with a base64 image.
+        :return: dict with "metadata" and "result_image" (bytes)
         """
-        token = self._generateToken()
-        url = f"{self.base_url}/inferencia"
-        headers = {
-            "Authorization": f"Bearer {token}",
-        }
+        headers = {"Accept": "multipart/mixed, application/json;q=0.9"}
 
         # Prepare multipart form data
         files = {"image": (original_filename, image_data, "image/jpeg")}
         data = {"model_name": model_name}
 
-        response = requests.post(url, files=files, data=data, headers=headers)
+        response = self._request(
+            "generateInferenceResult", "POST", "/inferencia",
+            headers=headers, balanced=True, files=files, data=data
+        )
 
-        if response.status_code != 200:
-            response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "")
+        if content_type.startswith("multipart/"):
+            return self._parseMultipartResult(response.content, content_type)
 
-        return response.json()
+        # Fallback for NN API versions without binary results
+        json_response = response.json()
+        return {
+            "metadata": json_response["metadata"],
+            "result_image": base64.b64decode(json_response["result_image"]),
+        }
+
+    @staticmethod
+    def _parseMultipartResult(content, content_type):
+        """
+        Split a multipart/mixed inference response into its metadata and
+        result image. Slicing the image out of the body is its only copy:
+        the bytes are then handed as is to put_object and the thumbnails,
+        whose BytesIO shares them instead of copying.
+        """
+        boundary = None
+        for param in content_type.split(";")[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "boundary":
+                boundary = value.strip('"')
+        if not boundary:
+            raise ValueError("Multipart inference response without boundary")
+
+        delimiter = b"--" + boundary.encode("latin-1")
+        result = {}
+
+        position = content.find(delimiter)
+        while position != -1:
+            start = position + len(delimiter)
+            if content[start:start + 2] == b"--":
+                break  # Closing delimiter
+
+            headers_end = content.find(b"\r\n\r\n", start)
+            if headers_end == -1:
+                break
+            body_end = content.find(b"\r\n" + delimiter, headers_end)
+            if body_end == -1:
+                raise ValueError("Unterminated multipart inference response")
+
+            part_headers = content[start:headers_end].decode("latin-1").lower()
+            body = content[headers_end + 4:body_end]
+            if "application/json" in part_headers:
+                result["metadata"] = json.loads(body)
+            elif "image/" in part_headers:
+                result["result_image"] = body
+
+            position = body_end + 2
+
+        if "metadata" not in result or "result_image" not in result:
+            raise ValueError("Incomplete multipart inference response")
+
+        return result
 
     def requestTraining(self, data=None):
         """
@@ -57,17 +445,7 @@ class NnAPIClient:
                      hyperparameters
         :return: Training job response
         """
-        token = self._generateToken()
-        url = f"{self.base_url}/training"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-        }
-
-        response = requests.post(url, json=data, headers=headers)
-
-        if response.status_code != 200:
-            response.raise_for_status()
+        response = self._request("requestTraining", "POST", "/training", json=data)
 
         return response.json()
 
@@ -75,20 +453,14 @@ class NnAPIClient:
         """
         Upload dataset binary data to NN API for training
         """
-        token = self._generateToken()
-        url = f"{self.base_url}/datasets/upload"
-        headers = {
-            "Authorization": f"Bearer {token}",
-        }
-
         # Prepare multipart form data
         files = {"dataset": (filename, dataset_data, "application/zip")}
         data = {"dataset_id": dataset_id, "model_name": model_name}
 
-        response = requests.post(url, files=files, data=data, headers=headers)
-
-        if response.status_code != 200:
-            response.raise_for_status()
+        response = self._request(
+            "uploadDatasetForTraining", "POST", "/datasets/upload",
+            files=files, data=data
+        )
 
         return response.json()
 
@@ -97,17 +469,10 @@ class NnAPIClient:
         Get list of all training jobs
         :return: Training jobs response
         """
-        token = self._generateToken()
-        url = f"{self.base_url}/training"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-        }
-
-        response = requests.get(url, headers=headers)
-
-        if response.status_code != 200:
-            response.raise_for_status()
+        response = self._request(
+            "getTrainingJobs", "GET", "/training",
+            headers={"Content-Type": "application/json"}
+        )
 
         return response.json()
 
@@ -117,17 +482,10 @@ class NnAPIClient:
         :param job_id: ID of the training job to cancel
         :return: Cancellation response
         """
-        token = self._generateToken()
-        url = f"{self.base_url}/training/{job_id}"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-        }
-
-        response = requests.delete(url, headers=headers)
-
-        if response.status_code != 200:
-            response.raise_for_status()
+        response = self._request(
+            "cancelTrainingJob", "DELETE", f"/training/{job_id}",
+            headers={"Content-Type": "application/json"}
+        )
 
         return response.json()
 
@@ -136,16 +494,9 @@ class NnAPIClient:
         Get list of available models for inference
         :return: List of models
         """
-        token = self._generateToken()
-        url = f"{self.base_url}/models"
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json",
-        }
-
-        response = requests.get(url, headers=headers)
-
-        if response.status_code != 200:
-            response.raise_for_status()
+        response = self._request(
+            "getAvailableModels", "GET", "/models",
+            headers={"Content-Type": "application/json"}
+        )
 
         return response.json()
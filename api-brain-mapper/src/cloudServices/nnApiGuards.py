@@ -0,0 +1,210 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+from logs.logger import logger
+
+
+class NnApiOverloadedError(Exception):
+    """
+    The NN API call was rejected before being sent, because the NN API is
+    failing or too many calls are already in flight.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit of the NN API calls in flight in this process.
+    The limit grows by one every `limit` successful calls while it is in
+    use, and shrinks by `backoff` on every failure or slow call. Calls over
+    the limit wait up to `wait_timeout` seconds for a slot, then are
+    rejected instead of piling up.
+    A call is slow when it takes longer than `latency_target` seconds. When
+    no target is set (NN_API_LATENCY_TARGET empty), it is derived from the
+    model: `latency_tolerance` times the EWMA latency of the successful
+    calls, capped at `max_latency` (NN_API_READ_TIMEOUT). So a model that
+    always takes 30s isn't throttled down to one call, while a call much
+    slower than usual still shrinks the limit.
+    """
+    EWMA_ALPHA = 0.1
+
+    def __init__(self, initial_limit=None, min_limit=None, max_limit=None,
+                 latency_target=None, latency_tolerance=None, max_latency=None,
+                 backoff=0.9):
+        self.limit = float(initial_limit or os.getenv("NN_API_CONCURRENCY_INITIAL", 8))
+        self.min_limit = float(min_limit or os.getenv("NN_API_CONCURRENCY_MIN", 1))
+        self.max_limit = float(max_limit or os.getenv("NN_API_CONCURRENCY_MAX", 64))
+        latency_target = latency_target or os.getenv("NN_API_LATENCY_TARGET")
+        self.latency_target = float(latency_target) if latency_target else None
+        self.latency_tolerance = float(
+            latency_tolerance or os.getenv("NN_API_LATENCY_TOLERANCE", 2)
+        )
+        self.max_latency = float(max_latency or os.getenv("NN_API_READ_TIMEOUT", 120))
+        self.ewma_latency = None
+        self.backoff = backoff
+
+        self.in_flight = 0
+        self.accepted = 0
+        self.rejected = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, wait_timeout=0):
+        """
+        Take a slot for a call
+        :return: False if no slot was freed within wait_timeout seconds
+        """
+        deadline = time.monotonic() + wait_timeout
+        with self._condition:
+            while self.in_flight >= math.floor(self.limit):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.rejected += 1
+                    return False
+                self._condition.wait(remaining)
+            self.in_flight += 1
+            self.accepted += 1
+            return True
+
+    def release(self, elapsed=None, failed=False):
+        """
+        Free the slot of a call and adapt the limit to its outcome
+        :param elapsed: Seconds the call took, None if it was never sent
+        """
+        with self._condition:
+            self.in_flight -= 1
+            if elapsed is None:
+                self.accepted -= 1
+            elif failed or elapsed > self._getLatencyTarget():
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            elif self.in_flight + 1 >= self.limit / 2:
+                # Only grow while the limit is actually being used
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+            if elapsed is not None and not failed:
+                if self.ewma_latency is None:
+                    self.ewma_latency = elapsed
+                else:
+                    self.ewma_latency += self.EWMA_ALPHA * (elapsed - self.ewma_latency)
+            self._condition.notify()
+
+    def _getLatencyTarget(self):
+        if self.latency_target is not None:
+            return self.latency_target
+        if self.ewma_latency is None:
+            return self.max_latency  # No baseline yet
+        return min(self.max_latency, self.latency_tolerance * self.ewma_latency)
+
+    def getStats(self):
+        with self._condition:
+            return {
+                "limit": math.floor(self.limit),
+                "inFlight": self.in_flight,
+                "latencyTargetSeconds": self._getLatencyTarget(),
+                "ewmaLatencySeconds": self.ewma_latency,
+                "accepted": self.accepted,
+                "rejected": self.rejected,
+            }
+
+
+class CircuitBreaker:
+    """
+    Stop calling the NN API while most of the recent calls fail.
+    The circuit opens when at least `error_rate` of the last `window` calls
+    failed, and rejects every call for `cooldown` seconds. Then a single
+    trial call is let through: it closes the circuit if it succeeds and
+    opens it again if it fails.
+    Every state change starts a new generation. Calls are recorded with the
+    generation they were admitted under, and the outcome of a call admitted
+    before the last state change is ignored, so a slow call sent while the
+    circuit was closed can't decide the half-open trial.
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, window=None, error_rate=None, min_calls=None, cooldown=None):
+        self.window = int(window or os.getenv("NN_API_BREAKER_WINDOW", 20))
+        self.error_rate = float(error_rate or os.getenv("NN_API_BREAKER_ERROR_RATE", 0.5))
+        self.min_calls = int(min_calls or os.getenv("NN_API_BREAKER_MIN_CALLS", 10))
+        self.cooldown = float(cooldown or os.getenv("NN_API_BREAKER_COOLDOWN", 30))
+
+        self.state = self.CLOSED
+        self.generation = 0
+        self.opened_until = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self._outcomes = deque(maxlen=self.window)
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allowRequest(self):
+        """
+        :return: The generation the call is admitted under, to pass to
+                 record(), None if the call must be rejected
+        """
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() >= self.opened_until:
+                self._setState(self.HALF_OPEN)
+                self._trial_in_flight = False
+
+            if self.state == self.CLOSED:
+                return self.generation
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return self.generation
+
+            self.rejected += 1
+            return None
+
+    def record(self, failed, generation):
+        """
+        :param generation: Returned by allowRequest() when the call was admitted
+        """
+        with self._lock:
+            if generation != self.generation:
+                return  # Admitted before the last state change
+
+            if self.state == self.HALF_OPEN:
+                if failed:
+                    self._open()
+                else:
+                    self._setState(self.CLOSED)
+                    self._outcomes.clear()
+                    logger.info("NN API circuit breaker closed")
+                return
+
+            self._outcomes.append(failed)
+            if (self.state == self.CLOSED
+                    and len(self._outcomes) >= self.min_calls
+                    and sum(self._outcomes) / len(self._outcomes) >= self.error_rate):
+                self._open()
+
+    def _setState(self, state):
+        self.state = state
+        self.generation += 1
+
+    def _open(self):
+        self._setState(self.OPEN)
+        self.opened_until = time.monotonic() + self.cooldown
+        self.times_opened += 1
+        logger.warning(f"NN API circuit breaker open for {self.cooldown:.0f}s")
+
+    def getRetryAfter(self):
+        """Seconds until a call may be let through again"""
+        with self._lock:
+            return max(1, math.ceil(self.opened_until - time.monotonic()))
+
+    def getStats(self):
+        with self._lock:
+            outcomes = list(self._outcomes)
+            return {
+                "state": self.state,
+                "recentErrorRate": sum(outcomes) / len(outcomes) if outcomes else 0.0,
+                "timesOpened": self.times_opened,
+                "rejected": self.rejected,
+            }
@@ -0,0 +1,9 @@
+from ..database.dbConnection import db
+
+class DailyDetectionCount(db.Model):
+    __tablename__ = 'daily_detection_counts'
+    userId = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True, nullable=False)
+    day = db.Column(db.Date(), primary_key=True, nullable=False)
+    modelId = db.Column(db.Integer, db.ForeignKey('models.id'), primary_key=True, nullable=False)
+    classId = db.Column(db.Integer, primary_key=True, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,9 @@
+from ..database.dbConnection import db
+
+class DailyInferenceCount(db.Model):
+    __tablename__ = 'daily_inference_counts'
+    userId = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True, nullable=False)
+    day = db.Column(db.Date(), primary_key=True, nullable=False)
+    modelId = db.Column(db.Integer, db.ForeignKey('models.id'), primary_key=True, nullable=False)
+    inferenceCount = db.Column(db.Integer, nullable=False, default=0)
+    totalDetections = db.Column(db.Integer, nullable=False, default=0)
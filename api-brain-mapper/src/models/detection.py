@@ -0,0 +1,16 @@
+from ..database.dbConnection import db
+
+class Detection(db.Model):
+    __tablename__ = 'detections'
+    id = db.Column(db.Integer, primary_key=True, nullable=False)
+    inferenceId = db.Column(db.Integer, db.ForeignKey('inferences.id', ondelete='CASCADE'), nullable=False)
+    # Copied from the inference so analytics can filter without a join
+    userId = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    modelId = db.Column(db.Integer, db.ForeignKey('models.id'), nullable=False)
+    createdOn = db.Column(db.DateTime(), nullable=False)
+    classId = db.Column(db.Integer, nullable=False)
+    confidence = db.Column(db.Float, nullable=True)
+    bboxX1 = db.Column(db.Float, nullable=True)
+    bboxY1 = db.Column(db.Float, nullable=True)
+    bboxX2 = db.Column(db.Float, nullable=True)
+    bboxY2 = db.Column(db.Float, nullable=True)
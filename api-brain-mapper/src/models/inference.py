@@ -10,3 +10,22 @@ class Inference(db.Model):
     generatedImageUrl = db.Column(db.String, nullable=True)
     metadataUrl = db.Column(db.String, nullable=True)
     createdOn = db.Column(db.DateTime(), nullable=False)
+    imageHash = db.Column(db.String(64), nullable=True)  # SHA-256 of the original image
+
+    # Detection summary (NULL until the metadata has been summarized)
+    totalDetections = db.Column(db.Integer, nullable=True)
+    meanConfidence = db.Column(db.Float, nullable=True)
+    minConfidence = db.Column(db.Float, nullable=True)
+    maxConfidence = db.Column(db.Float, nullable=True)
+    # Metadata missing or malformed, the summary is empty
+    summaryFailed = db.Column(db.Boolean, nullable=False, default=False,
+                              server_default=db.false())
+
+    # Relationships
+    classCounts = db.relationship("InferenceClassCount",
+                                  cascade="all, delete-orphan",
+                                  passive_deletes=True)
+    detections = db.relationship("Detection",
+                                 lazy="dynamic",
+                                 cascade="all, delete-orphan",
+                                 passive_deletes=True)
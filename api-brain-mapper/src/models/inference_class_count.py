@@ -0,0 +1,7 @@
+from ..database.dbConnection import db
+
+class InferenceClassCount(db.Model):
+    __tablename__ = 'inference_class_counts'
+    inferenceId = db.Column(db.Integer, db.ForeignKey('inferences.id', ondelete='CASCADE'), primary_key=True, nullable=False)
+    classId = db.Column(db.Integer, primary_key=True, nullable=False)
+    count = db.Column(db.Integer, nullable=False)
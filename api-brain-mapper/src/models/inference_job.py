@@ -0,0 +1,20 @@
+from ..database.dbConnection import db
+
+class InferenceJob(db.Model):
+    __tablename__ = 'inference_jobs'
+    id = db.Column(db.Integer, primary_key=True, nullable=False)
+    userId = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    modelId = db.Column(db.Integer, db.ForeignKey('models.id'), nullable=False)
+    name = db.Column(db.String(60), nullable=False)
+    folderName = db.Column(db.String(32), nullable=False)  # MinIO folder holding the original image
+    status = db.Column(db.String(20), nullable=False)  # queued, running, completed or failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    errorMessage = db.Column(db.String(500), nullable=True)
+    inferenceId = db.Column(db.Integer, db.ForeignKey('inferences.id', ondelete='SET NULL'), nullable=True)
+    createdOn = db.Column(db.DateTime(), nullable=False)
+    startedOn = db.Column(db.DateTime(), nullable=True)
+    # Lease of the worker running the job: renewed while it runs, and only
+    # the claim holding the current token may finish the job
+    heartbeatOn = db.Column(db.DateTime(), nullable=True)
+    claimToken = db.Column(db.String(32), nullable=True)
+    finishedOn = db.Column(db.DateTime(), nullable=True)
@@ -0,0 +1,15 @@
+from ..database.dbConnection import db
+
+class InferenceTombstone(db.Model):
+    """MinIO folder of a deleted inference, waiting for the storage reaper"""
+    __tablename__ = 'inference_tombstones'
+    id = db.Column(db.Integer, primary_key=True, nullable=False)
+    # No foreign keys: the inference is already deleted, and the objects must
+    # be removed even if the user is deleted too
+    userId = db.Column(db.Integer, nullable=False)
+    inferenceId = db.Column(db.Integer, nullable=False)
+    prefix = db.Column(db.String(200), nullable=False)  # e.g. "<userId>/<folder>/"
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    errorMessage = db.Column(db.String(500), nullable=True)
+    createdOn = db.Column(db.DateTime(), nullable=False)
+    nextAttemptOn = db.Column(db.DateTime(), nullable=True)  # NULL once given up
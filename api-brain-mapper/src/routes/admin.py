@@ -1,3 +1,4 @@
+import os
 from flask import Blueprint, jsonify, abort, g, request
 from logs.logger import logger
 from sqlalchemy import select, func
@@ -9,6 +10,7 @@ from ..models.inference import Inference
 from ..models.user_session import UserSession
 from ..database.dbConnection import db
 from ..security.decorators_utils import auth_required
+from ..security.user_cache import invalidate_user
 from ..security.input_validation import InputValidator
 
 # Define router prefix
@@ -163,6 +165,7 @@ def update_user_role(user_id):
         old_role = user.role.name
         user.roleId = new_role_id
         db.session.commit()
+        invalidate_user(user_id)
 
         logger.info(
             f"Admin user {g.uid} changed role of user {user_id} from {old_role} to {new_role.name}"
@@ -240,6 +243,7 @@ def delete_user(user_id):
         # Delete the user (cascade will handle related records)
         db.session.delete(user)
         db.session.commit()
+        invalidate_user(user_id)
 
         logger.info(
             f"Admin user {g.uid} deleted user {user_id} ({user_email})"
@@ -334,3 +338,71 @@ def get_user_statistics(user_id):
     except Exception as e:
         logger.exception(f"Error retrieving user statistics: {str(e)}")
         return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@admin.route("/nn-api/metrics", methods=["GET"])
+@auth_required(["ADMIN", "SUPERADMIN"])
+def get_nn_api_metrics():
+    """
+    State of the NN API client of the worker process answering: concurrency
+    limiter, circuit breaker, replicas and latency per method.
+    Admin and SuperAdmin only
+    """
+    from ..routes.inferences import nnClient
+
+    return (
+        jsonify(
+            {
+                "success": True,
+                "pid": os.getpid(),
+                **nnClient.getGuardStats(),
+                "replicas": nnClient.getReplicaStats(),
+                "latency": nnClient.getLatencyStats(),
+            }
+        ),
+        200,
+    )
+
+
+@admin.route("/image-cache/metrics", methods=["GET"])
+@auth_required(["ADMIN", "SUPERADMIN"])
+def get_image_cache_metrics():
+    """
+    Hits, misses and usage of the image cache of the worker process answering
+    Admin and SuperAdmin only
+    """
+    from ..services.image_cache import get_image_cache
+
+    return (
+        jsonify({"success": True, "pid": os.getpid(), **get_image_cache().getStats()}),
+        200,
+    )
+
+
+@admin.route("/minio/metrics", methods=["GET"])
+@auth_required(["ADMIN", "SUPERADMIN"])
+def get_minio_metrics():
+    """
+    Connection pool usage of the MinIO client of the worker process
+    answering. saturatedWaits counts requests that waited for a connection.
+    Admin and SuperAdmin only
+    """
+    from ..cloudServices.minioConnections import getMinioPoolStats
+
+    return jsonify({"success": True, **getMinioPoolStats()}), 200
+
+
+@admin.route("/password-hashing/metrics", methods=["GET"])
+@auth_required(["ADMIN", "SUPERADMIN"])
+def get_password_hashing_metrics():
+    """
+    Queue depth and timings of the bcrypt threadpool of the worker process
+    answering
+    Admin and SuperAdmin only
+    """
+    from ..security.crypto_utils import getPasswordHashStats
+
+    return (
+        jsonify({"success": True, "pid": os.getpid(), **getPasswordHashStats()}),
+        200,
+    )
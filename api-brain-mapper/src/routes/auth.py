@@ -12,6 +12,7 @@ from ..database.dbConnection import db
 
 from ..security.jwt_utils import *
 from ..security.decorators_utils import auth_required
+from ..security.user_cache import get_authenticated_user
 from ..security.crypto_utils import *
 from ..security.rate_limiter import (
     rate_limit_login,
@@ -294,10 +295,7 @@ def isLoggedIn():
     # If token is valid, verify user still exists
     if isLoggedIn and uid:
         try:
-            stmt = select(User).where(User.id == uid)
-            result = db.session.execute(statement=stmt)
-            user = result.scalar_one_or_none()
-            if user is None:
+            if get_authenticated_user(uid) is None:
                 isLoggedIn = False
                 message = "User not found"
         except Exception:
@@ -3,22 +3,70 @@ import uuid
 import datetime
 import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
+from minio.error import S3Error
 
-from flask import Blueprint, request, jsonify, abort, g, Response
+from flask import Blueprint, request, jsonify, abort, g, Response, current_app, redirect
 from logs.logger import logger
 
 from ..database.dbConnection import db
 from ..models.inference import Inference
 from ..models.model import Model
 from ..models.audit_log import AuditLog
+from ..models.inference_job import InferenceJob
 from ..security.decorators_utils import auth_required
 from ..security.input_validation import InputValidator
 from ..security.file_upload_security import FileUploadSecurity
 from ..security.rate_limiter import rate_limit_api, rate_limit_file_upload
 from ..cloudServices.minioConnections import getMinioClient
 from ..cloudServices.nnApiConnections import NnAPIClient
+from ..cloudServices.nnApiGuards import NnApiOverloadedError
+from ..services.detection_rollup import remove_from_daily_rollups
+from ..services.inference_pipeline import (
+    get_inference_object_keys,
+    get_object_key_from_url,
+    get_stored_object_keys,
+    upload_original_image,
+    run_inference,
+    build_inference,
+    create_inference_record,
+    create_inference_records,
+    remove_uploaded_objects,
+)
+from ..services.inference_cache import (
+    hash_image,
+    find_cached_inference,
+    find_or_lock_cached_inference,
+    lock_inference_requests,
+    copy_inference_objects,
+    copy_stored_objects,
+)
+from ..services.image_cache import get_image_cache
+from ..services.thumbnails import (
+    get_pregenerated_variants,
+    get_thumbnail_variant,
+    get_thumbnail_key,
+    get_thumbnail_content_type,
+    create_thumbnail,
+    ensure_thumbnail,
+)
+from ..services.image_delivery import (
+    build_object_response,
+    get_presigned_object_url,
+    open_object_stream,
+)
+from ..services.zip_streaming import ZipEntry, stream_zip
+from ..services.inference_export import build_export_entries
+from ..services.storage_reaper import get_inference_prefix, tombstone_inferences
+from ..services.inference_jobs import (
+    enqueue_inference_job,
+    get_queue_position,
+    JOB_QUEUED,
+    JOB_COMPLETED,
+    JOB_FAILED,
+)
 
 load_dotenv()
 
@@ -32,6 +80,19 @@ nnClient = NnAPIClient(
 inferences = Blueprint("inferences", __name__, url_prefix="/inferences")
 
 
+def overloaded_response(error):
+    """503 telling the client when to retry an inference rejected unsent"""
+    return (
+        jsonify({"error": "Inference service is overloaded, please retry later"}),
+        503,
+        {"Retry-After": str(error.retry_after)},
+    )
+
+
+def get_api_base_url():
+    return os.getenv("API_BASE_URL") or "http://localhost:5000"
+
+
 # ------- All the routes -------
 @inferences.route("/generateInference", methods=["POST"])
 @auth_required()
@@ -71,11 +132,39 @@ def generateInference():
     except ValueError as e:
         abort(400, str(e))
 
+    image_hash = hash_image(image_data)
+
     # Generate unique folder and object keys
     folder_name = str(uuid.uuid4().hex)
-    imgObjectKey = f"{g.uid}/{folder_name}/original_img.jpg"
-    result_object_key = f"{g.uid}/{folder_name}/inference_result.jpg"
-    metadata_object_key = f"{g.uid}/{folder_name}/metadata.json"
+    object_keys = get_inference_object_keys(g.uid, folder_name)
+    imgObjectKey = object_keys["original"]
+
+    minioClient = getMinioClient()
+
+    # Async mode: store the image and let an inference worker do the rest
+    if request.args.get("async") in ("1", "true"):
+        try:
+            upload_original_image(minioClient, object_keys, image_data)
+            job = enqueue_inference_job(g.uid, model_id, name, folder_name)
+            db.session.commit()
+        except Exception:
+            logger.exception(f"Error queueing inference job for {imgObjectKey}")
+            db.session.rollback()
+            abort(500, "Error queueing inference")
+
+        logger.info(f"Queued inference job {job.id} for user {g.uid}: {imgObjectKey}")
+
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "jobId": job.id,
+                    "status": job.status,
+                    "statusUrl": f"{get_api_base_url()}/inferences/jobs/{job.id}",
+                }
+            ),
+            202,
+        )
 
     # Send to NN API
     try:
@@ -86,88 +175,47 @@ def generateInference():
             f"Generating inference for user {g.uid}: {imgObjectKey} with model {model_name}"
         )
 
-        # Send binary image data to NN API
-        json_response = nnClient.generateInferenceWithBinary(
-            image_data, model_name, imgObjectKey
+        # Same image already analyzed with this model: reuse its results.
+        # An identical request in flight is waited for instead of repeated.
+        cached_inference = find_or_lock_cached_inference(
+            g.uid, model, image_hash,
+            current_app.config.get("INFERENCE_SINGLE_FLIGHT_TIMEOUT", 120)
         )
+        if cached_inference:
+            metadata = copy_inference_objects(
+                minioClient, cached_inference, object_keys,
+                thumbnail_variants=get_pregenerated_variants()
+            )
+        else:
+            metadata = run_inference(
+                nnClient, minioClient, image_data, model_name, object_keys,
+                thumbnail_variants=get_pregenerated_variants()
+            )
 
-        # Extract base64 image and metadata from NN API response
-        result_image_b64 = json_response["result_image"]
-        metadata = json_response["metadata"]
-
-        import base64
-
-        result_image_data = base64.b64decode(result_image_b64)
-
-        # Upload images and metadata to MinIO
-        from io import BytesIO
-
-        minioClient = getMinioClient()
-        s3Bucket = os.getenv("S3_BUCKET_INFERENCES_RESULTS")
-
-        # Upload original image
-        minioClient.put_object(
-            s3Bucket,
-            imgObjectKey,
-            BytesIO(image_data),
-            length=len(image_data),
-            content_type="image/jpeg",
-        )
-
-        # Upload inference result image
-        minioClient.put_object(
-            s3Bucket,
-            result_object_key,
-            BytesIO(result_image_data),
-            length=len(result_image_data),
-            content_type="image/jpeg",
-        )
-
-        # Upload metadata as JSON
-        import json as json_lib
-
-        metadata_json = json_lib.dumps(metadata).encode("utf-8")
-        minioClient.put_object(
-            s3Bucket,
-            metadata_object_key,
-            BytesIO(metadata_json),
-            length=len(metadata_json),
-            content_type="application/json",
-        )
-
-        # Generate URLs for the uploaded files
-        s3LiveBaseUrl = os.getenv("S3_LIVE_BASE_URL") + s3Bucket
-        baseImageUrl = f"{s3LiveBaseUrl}/{imgObjectKey}"
-        generatedImageUrl = f"{s3LiveBaseUrl}/{result_object_key}"
-        metadataUrl = f"{s3LiveBaseUrl}/{metadata_object_key}"
-
+    except NnApiOverloadedError as e:
+        logger.warning(f"Inference of {imgObjectKey} rejected: {e}")
+        return overloaded_response(e)
     except Exception:
         logger.exception(f"Error generating inference for {imgObjectKey}")
         abort(500, "Error generating inference")
 
-    user_id = getattr(g, "uid", None)
-
-    # Create new inference record
-    new_inference = Inference(
-        userId=user_id,
-        modelId=model_id,
-        name=name,
-        baseImageUrl=baseImageUrl,
-        generatedImageUrl=generatedImageUrl,
-        metadataUrl=metadataUrl,
-        createdOn=datetime.datetime.utcnow(),
-    )
-
-    # Save inference in DB
+    # Save inference in DB along with its detections and daily rollups
     try:
-        db.session.add(new_inference)
+        new_inference = create_inference_record(
+            g.uid, model_id, name, object_keys, metadata, image_hash=image_hash
+        )
         db.session.commit()
     except Exception:
         logger.exception(f"Error saving in DB inference of {imgObjectKey}")
+        db.session.rollback()
+        remove_uploaded_objects(
+            minioClient,
+            get_stored_object_keys(object_keys, get_pregenerated_variants())
+        )
         abort(500, "Error while saving inference")
 
     # Respond with proxy URLs
-    api_base_url = os.getenv("API_BASE_URL") or "http://localhost:5000"
+    api_base_url = get_api_base_url()
 
     # Debug logging
     logger.debug(f"API_BASE_URL env var: {os.getenv('API_BASE_URL')}")
@@ -183,12 +231,260 @@ def generateInference():
                 "generatedImgUrl": f"{api_base_url}/inferences/{new_inference.id}/image/result",
                 "baseImageUrl": f"{api_base_url}/inferences/{new_inference.id}/image/original",
                 "id": new_inference.id,
+                "cached": cached_inference is not None,
             }
         ),
         200,
     )
 
 
+@inferences.route("/batch", methods=["POST"])
+@auth_required()
+@rate_limit_api(max_attempts=5, window_minutes=10)
+def generateInferenceBatch():
+    """
+    Generate inferences for many images with one request.
+    Images are sent to the NN API concurrently (INFERENCE_BATCH_CONCURRENCY)
+    and all the successful inferences are saved with a single bulk insert.
+    Form data:
+    - images: image files
+    - modelId: model used for every image
+    - names: optional name for each image, defaults to the filename
+    """
+    img_files = request.files.getlist("images")
+    names = request.form.getlist("names")
+    model_id = request.form.get("modelId", "1")
+
+    # Validate model_id
+    try:
+        model_id = int(model_id)
+    except (ValueError, TypeError):
+        abort(400, "Invalid model ID")
+
+    if model_id <= 0:
+        abort(400, "Invalid model ID")
+
+    model = Model.query.get(model_id)
+    if not model:
+        abort(404, "Model not found")
+
+    if not img_files:
+        abort(400, "At least one image file is required")
+
+    max_images = current_app.config.get("INFERENCE_BATCH_MAX_IMAGES", 50)
+    if len(img_files) > max_images:
+        abort(400, f"A batch can contain up to {max_images} images")
+
+    # Validate every image before calling the NN API
+    results = []
+    pending = []
+    for index, img_file in enumerate(img_files):
+        filename = img_file.filename or "unnamed"
+        name = names[index] if index < len(names) and names[index] else filename
+        name = InputValidator.sanitize_string(name, max_length=60)
+        image_data = img_file.read()
+
+        result = {"index": index, "filename": filename, "success": False}
+        results.append(result)
+
+        try:
+            FileUploadSecurity.validate_file_type(filename, image_data, "image")
+            FileUploadSecurity.validate_file_size(image_data, "image")
+        except ValueError as e:
+            result["error"] = str(e)
+            continue
+
+        object_keys = get_inference_object_keys(g.uid, uuid.uuid4().hex)
+        image_hash = hash_image(image_data)
+        cached_inference = find_cached_inference(g.uid, model, image_hash)
+        result["cached"] = cached_inference is not None
+        pending.append(
+            {
+                "result": result,
+                "name": name,
+                "image_data": image_data,
+                "object_keys": object_keys,
+                "image_hash": image_hash,
+                "cached_inference": cached_inference,
+                "duplicate_of": None,
+                "future": None,
+            }
+        )
+
+    # Wait for identical requests in flight, then look again for their results
+    missing = [item for item in pending if item["cached_inference"] is None]
+    if missing:
+        timeout = current_app.config.get("INFERENCE_SINGLE_FLIGHT_TIMEOUT", 120)
+        image_hashes = [item["image_hash"] for item in missing]
+        if lock_inference_requests(g.uid, model.id, image_hashes, timeout):
+            for item in missing:
+                item["cached_inference"] = find_cached_inference(
+                    g.uid, model, item["image_hash"]
+                )
+                item["result"]["cached"] = item["cached_inference"] is not None
+        else:
+            logger.warning(
+                f"Timed out waiting for identical inferences of user {g.uid}, running them again"
+            )
+
+    # Copies of the same image in this batch: only the first one is sent to
+    # the NN API, the others copy its results
+    first_by_hash = {}
+    for item in pending:
+        if item["cached_inference"] is None:
+            first = first_by_hash.setdefault(item["image_hash"], item)
+            if first is not item:
+                item["duplicate_of"] = first
+                item["result"]["cached"] = True
+
+    minioClient = getMinioClient()
+    model_name = model.name
+    user_id = g.uid
+    thumbnail_variants = get_pregenerated_variants()
+
+    def process_image(item):
+        if item["duplicate_of"]:
+            first = item["duplicate_of"]
+            # Submitted after every image sent to the NN API, so this never
+            # waits on a task still queued behind it
+            metadata = first["future"].result()
+            copy_stored_objects(
+                minioClient, first["object_keys"], item["object_keys"],
+                thumbnail_variants=thumbnail_variants
+            )
+            return metadata
+        if item["cached_inference"]:
+            return copy_inference_objects(
+                minioClient, item["cached_inference"], item["object_keys"],
+                thumbnail_variants=thumbnail_variants
+            )
+        return run_inference(
+            nnClient, minioClient, item["image_data"], model_name,
+            item["object_keys"], thumbnail_variants=thumbnail_variants
+        )
+
+    logger.info(
+        f"Generating batch of {len(pending)} inferences for user {user_id} with model {model_name}"
+    )
+
+    # Run the NN API calls concurrently, bounded by the configured cap
+    entries = []
+    uploaded_keys = []
+    retry_after = None
+    if pending:
+        concurrency = current_app.config.get("INFERENCE_BATCH_CONCURRENCY", 8)
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(pending))) as executor:
+            for item in sorted(pending, key=lambda item: item["duplicate_of"] is not None):
+                item["future"] = executor.submit(process_image, item)
+
+            for item in pending:
+                result = item["result"]
+                object_keys = item["object_keys"]
+                try:
+                    metadata = item["future"].result()
+                except NnApiOverloadedError as e:
+                    result["error"] = "Inference service is overloaded, please retry later"
+                    retry_after = max(retry_after or 0, e.retry_after)
+                    continue
+                except Exception:
+                    logger.exception(f"Error generating inference for {object_keys['original']}")
+                    result["error"] = "Error generating inference"
+                    continue
+
+                inference = build_inference(
+                    user_id, model_id, item["name"], object_keys,
+                    image_hash=item["image_hash"]
+                )
+                entries.append((result, inference, metadata))
+                uploaded_keys.extend(
+                    get_stored_object_keys(object_keys, thumbnail_variants)
+                )
+
+    # Save every inference with a single bulk insert
+    if entries:
+        try:
+            create_inference_records(
+                [(inference, metadata) for _, inference, metadata in entries]
+            )
+            db.session.commit()
+        except Exception:
+            logger.exception(f"Error saving in DB batch of inferences for user {user_id}")
+            db.session.rollback()
+            # Cached entries were copied to their own folder, so every
+            # entry's objects belong to this batch only
+            remove_uploaded_objects(minioClient, uploaded_keys)
+            abort(500, "Error while saving inferences")
+
+    api_base_url = get_api_base_url()
+    for result, inference, _ in entries:
+        result.update(
+            {
+                "success": True,
+                "id": inference.id,
+                "generatedImgUrl": f"{api_base_url}/inferences/{inference.id}/image/result",
+                "baseImageUrl": f"{api_base_url}/inferences/{inference.id}/image/original",
+            }
+        )
+
+    succeeded = len(entries)
+    response = jsonify(
+        {
+            "success": succeeded > 0,
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results,
+        }
+    )
+    if retry_after is None:
+        return response, 200
+
+    # Some images were rejected by the NN API guards
+    response.headers["Retry-After"] = str(retry_after)
+    return response, 200 if succeeded else 503
+
+
+@inferences.route("/jobs/<int:job_id>", methods=["GET"])
+@auth_required()
+@rate_limit_api(max_attempts=200, window_minutes=10)
+def get_inference_job_status(job_id):
+    """
+    Get the progress of an inference queued with ?async=1
+    """
+    job = InferenceJob.query.filter_by(id=job_id, userId=g.uid).first()
+    if not job:
+        abort(404, "Inference job not found")
+
+    response = {
+        "success": True,
+        "jobId": job.id,
+        "status": job.status,
+        "attempts": job.attempts,
+        "createdOn": job.createdOn.isoformat() + "Z",
+        "startedOn": job.startedOn.isoformat() + "Z" if job.startedOn else None,
+        "finishedOn": job.finishedOn.isoformat() + "Z" if job.finishedOn else None,
+    }
+
+    if job.status == JOB_QUEUED:
+        response["queuePosition"] = get_queue_position(job)
+    elif job.status == JOB_COMPLETED:
+        api_base_url = get_api_base_url()
+        response["id"] = job.inferenceId
+        response["generatedImgUrl"] = f"{api_base_url}/inferences/{job.inferenceId}/image/result"
+        response["baseImageUrl"] = f"{api_base_url}/inferences/{job.inferenceId}/image/original"
+    elif job.status == JOB_FAILED:
+        response["error"] = "Error generating inference"
+
+    return jsonify(response), 200
+
+
+def metadata_cache_headers(response, etag):
+    """Let clients keep the metadata and revalidate it with its ETag"""
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
 @inferences.route("/getInferenceMetadata/<int:inference_id>", methods=["GET"])
 @auth_required()
 @rate_limit_api(max_attempts=10, window_minutes=5)
@@ -203,6 +499,11 @@ def getInferenceMetadata(inference_id):
         if not inference:
             abort(404, "Inference not found")
 
+        # Metadata never changes once stored, the inference id identifies it
+        etag = f"inference-{inference.id}-metadata"
+        if request.if_none_match.contains(etag):
+            return metadata_cache_headers(Response(status=304), etag)
+
         # Assuming metadata is stored alongside the generated image
         base_object_key = inference.generatedImageUrl.split("/")[
             -2:
@@ -227,9 +528,9 @@ def getInferenceMetadata(inference_id):
             # Parse JSON content
             metadata = json.loads(metadata_content.decode("utf-8"))
 
-            return (
+            return metadata_cache_headers(
                 jsonify({"success": True, "metadata": metadata, "source": "minio"}),
-                200,
+                etag,
             )
 
         except Exception as e:
@@ -239,7 +540,7 @@ def getInferenceMetadata(inference_id):
             if inference.metadataUrl:
                 response = requests.get(inference.metadataUrl)
                 if response.status_code == 200:
-                    return (
+                    return metadata_cache_headers(
                         jsonify(
                             {
                                 "success": True,
@@ -247,7 +548,7 @@ def getInferenceMetadata(inference_id):
                                 "source": "url",
                             }
                         ),
-                        200,
+                        etag,
                     )
 
         abort(404, "Metadata not found")
@@ -268,10 +569,23 @@ def serve_inference_image(inference_id, image_type):
     Args:
         inference_id: The ID of the inference
         image_type: Either 'original' or 'result'
+    Query params:
+        w: Width of a thumbnail variant
+        format: 'jpeg' or 'webp' thumbnail variant
     """
     if image_type not in ["original", "result"]:
         abort(400, "Invalid image type. Must be 'original' or 'result'")
 
+    # Thumbnails are generated on the first request and stored in MinIO
+    variant = None
+    if request.args.get("w") is not None or request.args.get("format") is not None:
+        try:
+            variant = get_thumbnail_variant(
+                request.args.get("w"), request.args.get("format")
+            )
+        except ValueError as e:
+            abort(400, str(e))
+
     try:
         # Get the inference from database and verify ownership
         inference = Inference.query.filter_by(id=inference_id, userId=g.uid).first()
@@ -309,22 +623,49 @@ def serve_inference_image(inference_id, image_type):
 
         # Get image from MinIO
         minioClient = getMinioClient()
+        source_key = object_key
+        mimetype = "image/jpeg"
+        if variant:
+            object_key = get_thumbnail_key(source_key, *variant)
+            mimetype = get_thumbnail_content_type(variant[1])
 
         try:
-            response = minioClient.get_object(bucket, object_key)
-            image_data = response.read()
-            response.close()
-            response.release_conn()
+            # Redirect mode: MinIO serves the bytes through a presigned URL
+            if current_app.config.get("INFERENCE_IMAGE_REDIRECT"):
+                if variant:
+                    ensure_thumbnail(minioClient, bucket, source_key, *variant)
+                url, max_age = get_presigned_object_url(
+                    minioClient, bucket, object_key,
+                    int(os.getenv("S3_PRESIGNED_EXPIRATION", 600))
+                )
+                response = redirect(url, 302)
+                response.headers["Cache-Control"] = f"private, max-age={max_age}"
+                return response
+
+            # Stream the image in chunks with proper headers for caching,
+            # answering revalidations and byte ranges. Hot images are served
+            # from the local image cache.
+            def image_response():
+                return build_object_response(
+                    minioClient,
+                    bucket,
+                    object_key,
+                    request,
+                    mimetype=mimetype,
+                    headers={
+                        "Cache-Control": "public, max-age=31536000, immutable",
+                        "Content-Disposition": f'inline; filename="{os.path.basename(object_key)}"',
+                    },
+                    cache=get_image_cache(),
+                )
 
-            # Return image with proper headers for caching
-            return Response(
-                image_data,
-                mimetype="image/jpeg",
-                headers={
-                    "Cache-Control": "public, max-age=31536000, immutable",
-                    "Content-Disposition": f'inline; filename="{os.path.basename(object_key)}"',
-                },
-            )
+            try:
+                return image_response()
+            except S3Error as e:
+                if not variant or e.code != "NoSuchKey":
+                    raise
+                create_thumbnail(minioClient, bucket, source_key, *variant)
+                return image_response()
 
         except Exception as e:
             logger.error(f"Error fetching image from MinIO: {str(e)}")
@@ -341,24 +682,6 @@ def serve_inference_image(inference_id, image_type):
 @auth_required()
 @rate_limit_api(max_attempts=5, window_minutes=10)
 def download_inferences(inference_id):
-    import tempfile
-    import zipfile
-    import os
-    import shutil
-
-    # Create a temporary directory for this operation
-    temp_dir = None
-    zip_path = None
-
-    def cleanup_temp_dir():
-        """Clean up temporary directory"""
-        if temp_dir and os.path.exists(temp_dir):
-            try:
-                shutil.rmtree(temp_dir)
-                pass
-            except Exception:
-                pass
-
     try:
         # Fetch the inference from the database
         inference = Inference.query.filter_by(id=inference_id, userId=g.uid).first()
@@ -374,120 +697,32 @@ def download_inferences(inference_id):
                 400,
             )
 
-        temp_dir = tempfile.mkdtemp(prefix=f"inference_{inference_id}_")
-
-        # Prepare file paths in temp directory
-        base_image_path = os.path.join(temp_dir, f"original_image_{inference.id}.jpg")
-        generated_image_path = os.path.join(
-            temp_dir, f"analyzed_image_{inference.id}.jpg"
-        )
-        metadata_path = os.path.join(temp_dir, f"metadata_{inference.id}.json")
-
-        # Download files from MinIO
         minioClient = getMinioClient()
         s3Bucket = os.getenv("S3_BUCKET_INFERENCES_RESULTS")
 
-        try:
-            s3_live_base_url = os.getenv("S3_LIVE_BASE_URL")
-            s3_port = os.getenv("S3_PORT", "9000")
-
-            def extract_object_key_from_url(url):
-                if url.startswith(s3_live_base_url):
-                    path_after_base = url[len(s3_live_base_url) :]
-                else:
-                    alternative_bases = [
-                        f"http://localhost:{s3_port}/",
-                        f"http://127.0.0.1:{s3_port}/",
-                        f"http://s3:{s3_port}/",
-                    ]
-
-                    matched_base = None
-                    for alt_base in alternative_bases:
-                        if url.startswith(alt_base):
-                            matched_base = alt_base
-                            break
-
-                    if not matched_base:
-                        import re
-
-                        port_pattern = f"://[^/]+:{s3_port}/"
-                        match = re.search(port_pattern, url)
-                        if match:
-                            matched_base = url[: match.end()]
-                        else:
-                            url_parts = url.split("/")
-                            if len(url_parts) >= 4 and ":" in url_parts[2]:
-                                matched_base = "/".join(url_parts[:3]) + "/"
-                            else:
-                                raise ValueError(
-                                    f"URL doesn't match any expected MinIO pattern: {url}"
-                                )
-
-                    path_after_base = url[len(matched_base) :]
-
-                if path_after_base.startswith(f"{s3Bucket}/"):
-                    return path_after_base[len(f"{s3Bucket}/") :]
-                else:
-                    return path_after_base
-
-            base_object_key = extract_object_key_from_url(inference.baseImageUrl)
-            generated_object_key = extract_object_key_from_url(
-                inference.generatedImageUrl
-            )
-
-            folder_path = "/".join(base_object_key.split("/")[:-1])
-            metadata_object_key = f"{folder_path}/metadata.json"
-
-            try:
-                minioClient.fget_object(s3Bucket, base_object_key, base_image_path)
-            except Exception as e:
-                raise Exception(f"Failed to download original image: {str(e)}")
+        base_object_key = get_object_key_from_url(inference.baseImageUrl)
+        generated_object_key = get_object_key_from_url(inference.generatedImageUrl)
+        folder_path = "/".join(base_object_key.split("/")[:-1])
+        metadata_object_key = f"{folder_path}/metadata.json"
 
-            try:
-                minioClient.fget_object(
-                    s3Bucket, generated_object_key, generated_image_path
-                )
-            except Exception as e:
-                raise Exception(f"Failed to download analyzed image: {str(e)}")
+        files = [
+            (base_object_key, f"original_image_{inference.id}.jpg", "original image"),
+            (generated_object_key, f"analyzed_image_{inference.id}.jpg", "analyzed image"),
+            (metadata_object_key, f"analysis_metadata_{inference.id}.json", "metadata"),
+        ]
 
+        # Check every file before the response starts, errors can't be
+        # reported once the ZIP is being sent
+        sizes = {}
+        for object_key, _, file_desc in files:
             try:
-                minioClient.fget_object(s3Bucket, metadata_object_key, metadata_path)
+                sizes[object_key] = minioClient.stat_object(s3Bucket, object_key).size
             except Exception as e:
-                raise Exception(f"Failed to download metadata: {str(e)}")
-
-        except Exception as e:
-            cleanup_temp_dir()
-            abort(500, f"Download error: {str(e)}")
-
-        # Verify all files exist and have content
-        files_to_check = [
-            (base_image_path, "original image"),
-            (generated_image_path, "analyzed image"),
-            (metadata_path, "metadata"),
-        ]
-
-        for file_path, file_desc in files_to_check:
-            if not os.path.exists(file_path):
-                cleanup_temp_dir()
-                raise Exception(f"Failed to download {file_desc}")
-            if os.path.getsize(file_path) == 0:
-                cleanup_temp_dir()
+                raise Exception(f"Failed to download {file_desc}: {str(e)}")
+            if sizes[object_key] == 0:
                 raise Exception(f"{file_desc} is empty")
 
-        # Create ZIP file
-        zip_filename = f"inference_{inference.id}_results.zip"
-        zip_path = os.path.join(temp_dir, zip_filename)
-
-        with zipfile.ZipFile(
-            zip_path, "w", zipfile.ZIP_DEFLATED, compresslevel=6
-        ) as zipf:
-            # Add files with descriptive names
-            zipf.write(base_image_path, f"original_image_{inference.id}.jpg")
-            zipf.write(generated_image_path, f"analyzed_image_{inference.id}.jpg")
-            zipf.write(metadata_path, f"analysis_metadata_{inference.id}.json")
-
-            # Add a README file
-            readme_content = f"""Resultados de Análisis - ID: {inference.id}
+        readme_content = f"""Resultados de Análisis - ID: {inference.id}
 Generado el: {inference.createdOn}
 Modelo utilizado: {inference.modelId}
 
@@ -498,44 +733,43 @@ Archivos incluidos:
 
 Este archivo ZIP fue generado por el sistema de análisis de IA NeuroBerry.
 """
-            zipf.writestr(f"README_{inference.id}.txt", readme_content)
+        date_time = (inference.createdOn or datetime.datetime.now()).timetuple()[:6]
 
-        if not os.path.exists(zip_path):
-            cleanup_temp_dir()
-            raise Exception("Failed to create ZIP file")
+        def object_chunks(object_key):
+            # Opened only when its entry is written, one MinIO connection
+            # at a time
+            yield from open_object_stream(minioClient, s3Bucket, object_key)
 
-        zip_size = os.path.getsize(zip_path)
-        if zip_size == 0:
-            cleanup_temp_dir()
-            raise Exception("Created ZIP file is empty")
+        entries = [
+            ZipEntry(name, object_chunks(object_key), date_time, sizes[object_key])
+            for object_key, name, _ in files
+        ]
+        entries.append(
+            ZipEntry(f"README_{inference.id}.txt", [readme_content.encode()], date_time)
+        )
 
-        def generate_file():
+        def generate_zip():
             try:
-                with open(zip_path, "rb") as f:
-                    while True:
-                        chunk = f.read(8192)
-                        if not chunk:
-                            break
-                        yield chunk
-            finally:
-                cleanup_temp_dir()
-
-        response = Response(
-            generate_file(),
+                yield from stream_zip(entries)
+            except GeneratorExit:
+                raise
+            except Exception:
+                logger.exception(f"Error streaming ZIP of inference {inference_id}")
+                raise
+
+        # Built while it is sent, so the size isn't known up front
+        zip_filename = f"inference_{inference.id}_results.zip"
+        return Response(
+            generate_zip(),
             mimetype="application/zip",
             headers={
                 "Content-Disposition": f'attachment; filename="{secure_filename(zip_filename)}"',
-                "Content-Length": str(zip_size),
                 "Cache-Control": "no-cache",
                 "Content-Type": "application/zip",
             },
         )
 
-        return response
-
     except Exception as e:
-        cleanup_temp_dir()
-
         return (
             jsonify(
                 {
@@ -548,6 +782,88 @@ Este archivo ZIP fue generado por el sistema de análisis de IA NeuroBerry.
         )
 
 
+@inferences.route("/export", methods=["POST"])
+@auth_required()
+@rate_limit_api(max_attempts=5, window_minutes=10)
+def export_inferences():
+    """
+    Export many inferences as a single ZIP, streamed while it is built.
+    Objects are read from MinIO by a pool of workers ahead of the writer
+    (INFERENCE_EXPORT_PREFETCH), and detections.csv holds the detections of
+    every exported inference.
+    JSON body, either:
+    - ids: list of inference ids
+    - startDate, endDate: YYYY-MM-DD, both included
+    """
+    data = request.get_json(silent=True) or {}
+    max_inferences = current_app.config.get("INFERENCE_EXPORT_MAX_INFERENCES", 500)
+
+    query = Inference.query.filter_by(userId=g.uid)
+    if data.get("ids") is not None:
+        ids = data["ids"]
+        if not isinstance(ids, list) or not ids:
+            abort(400, "ids must be a non-empty list")
+        try:
+            ids = {int(inference_id) for inference_id in ids}
+        except (ValueError, TypeError):
+            abort(400, "Invalid inference ID")
+        if len(ids) > max_inferences:
+            abort(400, f"An export can contain up to {max_inferences} inferences")
+        query = query.filter(Inference.id.in_(ids))
+    elif data.get("startDate") and data.get("endDate"):
+        try:
+            start_date = datetime.datetime.strptime(data["startDate"], "%Y-%m-%d")
+            end_date = datetime.datetime.strptime(data["endDate"], "%Y-%m-%d")
+        except (ValueError, TypeError):
+            abort(400, "Dates must be in YYYY-MM-DD format")
+        if end_date < start_date:
+            abort(400, "endDate must not be before startDate")
+        query = query.filter(
+            Inference.createdOn >= start_date,
+            Inference.createdOn < end_date + datetime.timedelta(days=1),
+        )
+    else:
+        abort(400, "Either ids or startDate and endDate are required")
+
+    inferences = query.order_by(Inference.createdOn, Inference.id).limit(
+        max_inferences + 1
+    ).all()
+    if not inferences:
+        abort(404, "No inferences found")
+    if len(inferences) > max_inferences:
+        abort(400, f"An export can contain up to {max_inferences} inferences")
+
+    entries = build_export_entries(
+        getMinioClient(),
+        os.getenv("S3_BUCKET_INFERENCES_RESULTS"),
+        inferences,
+        current_app.config.get("INFERENCE_EXPORT_PREFETCH", 4),
+    )
+
+    user_id = g.uid
+
+    def generate_zip():
+        try:
+            yield from stream_zip(entries)
+        except GeneratorExit:
+            raise
+        except Exception:
+            logger.exception(f"Error streaming export of user {user_id}")
+            raise
+
+    logger.info(f"User {g.uid} exporting {len(inferences)} inferences")
+    zip_filename = f"inferences_export_{datetime.datetime.now():%Y%m%d_%H%M%S}.zip"
+    return Response(
+        generate_zip(),
+        mimetype="application/zip",
+        headers={
+            "Content-Disposition": f'attachment; filename="{secure_filename(zip_filename)}"',
+            "Cache-Control": "no-cache",
+            "Content-Type": "application/zip",
+        },
+    )
+
+
 @inferences.route("/<int:inference_id>", methods=["DELETE"])
 @auth_required()
 @rate_limit_api(max_attempts=5, window_minutes=10)
@@ -606,6 +922,7 @@ def delete_inference(inference_id):
                 logger.info(
                     f"Deleted {len(objects)} objects from MinIO for inference {inference_id}"
                 )
+                get_image_cache().invalidate_prefix(s3Bucket, f"{g.uid}/{folder_name}/")
             else:
                 logger.warning(
                     f"No objects found in MinIO for inference {inference_id}"
@@ -626,6 +943,7 @@ def delete_inference(inference_id):
             )
 
         # Only after successfully deleting from MinIO, delete the DB record
+        remove_from_daily_rollups(inference)
         db.session.delete(inference)
         db.session.commit()
         logger.info(f"Deleted inference {inference_id} from database")
@@ -663,3 +981,73 @@ def delete_inference(inference_id):
             ),
             500,
         )
+
+
+@inferences.route("", methods=["DELETE"])
+@auth_required()
+@rate_limit_api(max_attempts=5, window_minutes=10)
+def delete_inferences():
+    """
+    Delete many inferences at once. They are removed from the DB right away
+    and their objects are removed from MinIO later by the storage reaper
+    (flask storage-reaper), so the request doesn't wait on storage.
+    JSON body:
+    - ids: list of inference ids
+    """
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids")
+    if not isinstance(ids, list) or not ids:
+        abort(400, "ids must be a non-empty list")
+    try:
+        ids = {int(inference_id) for inference_id in ids}
+    except (ValueError, TypeError):
+        abort(400, "Invalid inference ID")
+
+    max_ids = current_app.config.get("INFERENCE_DELETE_MAX_IDS", 1000)
+    if len(ids) > max_ids:
+        abort(400, f"Up to {max_ids} inferences can be deleted at once")
+
+    try:
+        to_delete = Inference.query.filter(
+            Inference.userId == g.uid, Inference.id.in_(ids)
+        ).all()
+        deleted_ids = sorted(inference.id for inference in to_delete)
+        prefixes = [get_inference_prefix(inference) for inference in to_delete]
+
+        tombstone_inferences(to_delete)
+        now = datetime.datetime.utcnow()
+        for inference_id in deleted_ids:
+            db.session.add(AuditLog(
+                userId=g.uid,
+                action="INFERENCE_DELETED",
+                entityType="inference",
+                entityId=inference_id,
+                timestamp=now,
+            ))
+        db.session.commit()
+        logger.info(f"User {g.uid} deleted {len(deleted_ids)} inferences")
+    except Exception as e:
+        logger.exception(f"Error deleting inferences of user {g.uid}: {str(e)}")
+        db.session.rollback()
+        return (
+            jsonify({"error": "Error deleting inferences", "message": str(e)}),
+            500,
+        )
+
+    # Stop serving the cached images of this worker right away
+    s3Bucket = os.getenv("S3_BUCKET_INFERENCES_RESULTS")
+    image_cache = get_image_cache()
+    for prefix in prefixes:
+        image_cache.invalidate_prefix(s3Bucket, prefix)
+
+    return (
+        jsonify(
+            {
+                "success": True,
+                "message": "Inferences deleted",
+                "deleted": deleted_ids,
+                "notFound": sorted(ids - set(deleted_ids)),
+            }
+        ),
+        202,
+    )
@@ -1,15 +1,16 @@
 from flask import Blueprint, jsonify, g, request
 from logs.logger import logger
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, cast, DateTime
 from collections import defaultdict
-import json
 
 from ..models.inference import Inference
+from ..models.inference_class_count import InferenceClassCount
+from ..models.daily_detection_count import DailyDetectionCount
+from ..models.daily_inference_count import DailyInferenceCount
 from ..database.dbConnection import db
 from ..security.decorators_utils import auth_required
-from ..cloudServices.minioConnections import getMinioClient
-import os
+from ..services.detection_summary import summarize_pending_inferences
 
 # Define router prefix
 metrics = Blueprint("metrics", __name__, url_prefix="/metrics")
@@ -20,15 +21,14 @@ metrics = Blueprint("metrics", __name__, url_prefix="/metrics")
 def get_class_detection_metrics():
     """
     Get aggregated class detection counts across all user inferences
-    Fetches and processes metadata from each inference to count detections
+    Aggregates the detection summaries stored with each inference
     """
     try:
         user_id = g.uid
         
-        # Get all inferences for the user
-        inferences = Inference.query.filter_by(userId=user_id).all()
+        total_inferences = Inference.query.filter_by(userId=user_id).count()
         
-        if not inferences:
+        if not total_inferences:
             return jsonify({
                 "success": True,
                 "totalInferences": 0,
@@ -38,62 +38,54 @@ def get_class_detection_metrics():
                 "inferenceHistory": []
             }), 200
         
-        # Initialize counters
-        class_counts = defaultdict(int)
-        total_detections = 0
-        inference_history = []
-        
-        # MinIO client
-        minioClient = getMinioClient()
-        s3Bucket = os.getenv("S3_BUCKET_INFERENCES_RESULTS")
-        
-        # Process each inference
-        for inference in inferences:
-            try:
-                # Extract metadata object key from URL
-                if not inference.generatedImageUrl:
-                    continue
-                    
-                url_parts = inference.generatedImageUrl.split("/")
-                if len(url_parts) >= 2:
-                    folder_name = url_parts[-2]
-                    metadata_object_key = f"{user_id}/{folder_name}/metadata.json"
-                    
-                    # Fetch metadata from MinIO
-                    try:
-                        response = minioClient.get_object(s3Bucket, metadata_object_key)
-                        metadata_content = response.read()
-                        response.close()
-                        response.release_conn()
-                        
-                        metadata = json.loads(metadata_content.decode('utf-8'))
-                        
-                        # Count detections by class
-                        detections = metadata.get('detections', [])
-                        inference_detection_counts = defaultdict(int)
-                        
-                        for detection in detections:
-                            class_id = detection.get('class_id')
-                            if class_id is not None:
-                                class_counts[class_id] += 1
-                                inference_detection_counts[class_id] += 1
-                                total_detections += 1
-                        
-                        # Add to history
-                        inference_history.append({
-                            "id": inference.id,
-                            "date": inference.createdOn.isoformat() if inference.createdOn else None,
-                            "totalDetections": len(detections),
-                            "classCounts": dict(inference_detection_counts)
-                        })
-                        
-                    except Exception as e:
-                        logger.warning(f"Could not fetch metadata for inference {inference.id}: {str(e)}")
-                        continue
-                        
-            except Exception as e:
-                logger.warning(f"Error processing inference {inference.id}: {str(e)}")
-                continue
+        # Summarize inferences created before summaries were stored
+        summarize_pending_inferences(user_id)
+        
+        # Aggregate detections by class
+        class_rows = db.session.query(
+            InferenceClassCount.classId,
+            func.sum(InferenceClassCount.count)
+        ).join(
+            Inference, Inference.id == InferenceClassCount.inferenceId
+        ).filter(
+            Inference.userId == user_id
+        ).group_by(InferenceClassCount.classId).all()
+        
+        class_counts = {class_id: int(count) for class_id, count in class_rows}
+        total_detections = sum(class_counts.values())
+        
+        # Build per-inference history from the stored summaries
+        history_counts = defaultdict(dict)
+        history_count_rows = db.session.query(
+            InferenceClassCount.inferenceId,
+            InferenceClassCount.classId,
+            InferenceClassCount.count
+        ).join(
+            Inference, Inference.id == InferenceClassCount.inferenceId
+        ).filter(
+            Inference.userId == user_id
+        ).all()
+        for inference_id, class_id, count in history_count_rows:
+            history_counts[inference_id][class_id] = count
+        
+        history_rows = db.session.query(
+            Inference.id,
+            Inference.createdOn,
+            Inference.totalDetections
+        ).filter(
+            Inference.userId == user_id,
+            Inference.totalDetections.isnot(None)
+        ).order_by(Inference.createdOn.desc()).all()
+        
+        inference_history = [
+            {
+                "id": inference_id,
+                "date": created_on.isoformat() if created_on else None,
+                "totalDetections": inference_total,
+                "classCounts": history_counts.get(inference_id, {})
+            }
+            for inference_id, created_on, inference_total in history_rows
+        ]
         
         # Calculate percentages
         class_percentages = {}
@@ -101,14 +93,11 @@ def get_class_detection_metrics():
             for class_id, count in class_counts.items():
                 class_percentages[class_id] = round((count / total_detections) * 100, 2)
         
-        # Sort inference history by date
-        inference_history.sort(key=lambda x: x['date'] if x['date'] else '', reverse=True)
-        
         return jsonify({
             "success": True,
-            "totalInferences": len(inferences),
+            "totalInferences": total_inferences,
             "totalDetections": total_detections,
-            "classCounts": dict(class_counts),
+            "classCounts": class_counts,
             "classPercentages": class_percentages,
             "inferenceHistory": inference_history
         }), 200
@@ -130,94 +119,70 @@ def get_time_series_metrics():
         
         # Get grouping parameter (day, week, month)
         grouping = request.args.get('grouping', 'day')
+        if grouping not in ('day', 'week'):
+            grouping = 'month'
         
         # Get date range parameters
         days_back = int(request.args.get('days', 30))
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days_back)
         
-        # Get all inferences in date range
-        inferences = Inference.query.filter(
-            Inference.userId == user_id,
-            Inference.createdOn >= start_date,
-            Inference.createdOn <= end_date
-        ).order_by(Inference.createdOn).all()
-        
-        if not inferences:
+        # Summarize inferences created before summaries were stored
+        summarize_pending_inferences(user_id)
+        
+        # Weeks and months are derived from the daily rollups.
+        # Postgres weeks start on Monday, same as date.weekday()
+        def bucket_of(day_column):
+            return func.date_trunc(grouping, cast(day_column, DateTime)).label("bucket")
+        
+        inference_bucket = bucket_of(DailyInferenceCount.day)
+        bucket_rows = db.session.query(
+            inference_bucket,
+            func.sum(DailyInferenceCount.inferenceCount),
+            func.sum(DailyInferenceCount.totalDetections)
+        ).filter(
+            DailyInferenceCount.userId == user_id,
+            DailyInferenceCount.day >= start_date.date(),
+            DailyInferenceCount.day <= end_date.date()
+        ).group_by(inference_bucket).order_by(inference_bucket).all()
+        
+        if not bucket_rows:
             return jsonify({
                 "success": True,
                 "timeSeries": [],
                 "totalDetections": 0
             }), 200
         
-        # MinIO client
-        minioClient = getMinioClient()
-        s3Bucket = os.getenv("S3_BUCKET_INFERENCES_RESULTS")
+        class_bucket = bucket_of(DailyDetectionCount.day)
+        class_rows = db.session.query(
+            class_bucket,
+            DailyDetectionCount.classId,
+            func.sum(DailyDetectionCount.count)
+        ).filter(
+            DailyDetectionCount.userId == user_id,
+            DailyDetectionCount.day >= start_date.date(),
+            DailyDetectionCount.day <= end_date.date()
+        ).group_by(class_bucket, DailyDetectionCount.classId).all()
+        
+        bucket_class_counts = defaultdict(dict)
+        for bucket_start, class_id, count in class_rows:
+            bucket_class_counts[bucket_start][class_id] = int(count)
+        
+        def format_bucket(bucket_start):
+            if grouping == 'month':
+                return bucket_start.strftime('%Y-%m')
+            return bucket_start.date().isoformat()
         
-        # Group data by date
-        time_series_data = defaultdict(lambda: {
-            "totalDetections": 0,
-            "classCounts": defaultdict(int),
-            "inferenceCount": 0
-        })
-        
-        total_detections = 0
-        
-        # Process each inference
-        for inference in inferences:
-            try:
-                # Group by date
-                if grouping == 'day':
-                    date_key = inference.createdOn.date().isoformat()
-                elif grouping == 'week':
-                    week_start = inference.createdOn.date() - timedelta(days=inference.createdOn.weekday())
-                    date_key = week_start.isoformat()
-                else:  # month
-                    date_key = inference.createdOn.strftime('%Y-%m')
-                
-                # Extract metadata
-                if not inference.generatedImageUrl:
-                    continue
-                
-                url_parts = inference.generatedImageUrl.split("/")
-                if len(url_parts) >= 2:
-                    folder_name = url_parts[-2]
-                    metadata_object_key = f"{user_id}/{folder_name}/metadata.json"
-                    
-                    try:
-                        response = minioClient.get_object(s3Bucket, metadata_object_key)
-                        metadata_content = response.read()
-                        response.close()
-                        response.release_conn()
-                        
-                        metadata = json.loads(metadata_content.decode('utf-8'))
-                        detections = metadata.get('detections', [])
-                        
-                        time_series_data[date_key]["inferenceCount"] += 1
-                        time_series_data[date_key]["totalDetections"] += len(detections)
-                        
-                        for detection in detections:
-                            class_id = detection.get('class_id')
-                            if class_id is not None:
-                                time_series_data[date_key]["classCounts"][class_id] += 1
-                                total_detections += 1
-                        
-                    except Exception as e:
-                        logger.warning(f"Could not fetch metadata for inference {inference.id}: {str(e)}")
-                        continue
-                        
-            except Exception as e:
-                logger.warning(f"Error processing inference {inference.id}: {str(e)}")
-                continue
-        
-        # Convert to list and sort by date
         time_series = []
-        for date_key, data in sorted(time_series_data.items()):
+        total_detections = 0
+        for bucket_start, inference_count, bucket_total in bucket_rows:
+            class_counts = bucket_class_counts.get(bucket_start, {})
+            total_detections += sum(class_counts.values())
             time_series.append({
-                "date": date_key,
-                "totalDetections": data["totalDetections"],
-                "classCounts": dict(data["classCounts"]),
-                "inferenceCount": data["inferenceCount"]
+                "date": format_bucket(bucket_start),
+                "totalDetections": int(bucket_total or 0),
+                "classCounts": class_counts,
+                "inferenceCount": int(inference_count)
             })
         
         return jsonify({
@@ -9,6 +9,7 @@ from ..models.user_session import UserSession
 from ..models.user import User
 from ..database.dbConnection import db
 from ..security.decorators_utils import auth_required
+from ..security.user_cache import invalidate_user
 from ..security.input_validation import InputValidator
 from ..security.crypto_utils import hashPassword, checkPasswordHash
 
@@ -359,6 +360,7 @@ def update_profile():
         user.email = email
 
         db.session.commit()
+        invalidate_user(g.uid)
 
         logger.info(f"User {g.uid} updated their profile information")
 
@@ -471,6 +473,7 @@ def delete_account():
         # Delete the user (this will cascade delete related records due to foreign key constraints)
         db.session.delete(user)
         db.session.commit()
+        invalidate_user(user_id)
 
         logger.info(
             f"User account {user_email} (ID: {user_id}) was permanently deleted"
@@ -1,9 +1,103 @@
+import os
+import time
+import threading
 from .bcrypt import bcrypt
 
+# Native threads running bcrypt for the greenlets of this process
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+_stats = {"queued": 0, "running": 0, "peakQueued": 0, "completed": 0,
+          "waitSeconds": 0.0, "runSeconds": 0.0}
+
+
+def _nativeLock():
+    """Lock usable from the pool threads, threading may be patched by gevent"""
+    try:
+        from gevent.monkey import get_original
+        return get_original("threading", "Lock")()
+    except ImportError:
+        return threading.Lock()
+
+
+_stats_lock = _nativeLock()
+
+
+def _getPasswordPool():
+    """
+    Get the native threadpool of this process, None when gevent is not
+    patching threads (flask CLI, dev server) or PASSWORD_HASH_THREADS is 0,
+    where bcrypt runs inline.
+    bcrypt releases the GIL, so up to PASSWORD_HASH_THREADS hashes run in
+    parallel while the event loop keeps serving the other requests.
+    """
+    global _pool, _pool_pid
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            try:
+                from gevent import monkey
+                from gevent.threadpool import ThreadPool
+            except ImportError:
+                return None
+            threads = int(os.getenv("PASSWORD_HASH_THREADS", 4))
+            if threads <= 0 or not monkey.is_module_patched("threading"):
+                return None
+            _pool = ThreadPool(threads)
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def _runPasswordOperation(function, *args):
+    pool = _getPasswordPool()
+    if pool is None:
+        return function(*args)
+
+    submitted_at = time.monotonic()
+    with _stats_lock:
+        _stats["queued"] += 1
+        _stats["peakQueued"] = max(_stats["peakQueued"], _stats["queued"])
+
+    def run():
+        started_at = time.monotonic()
+        with _stats_lock:
+            _stats["queued"] -= 1
+            _stats["running"] += 1
+            _stats["waitSeconds"] += started_at - submitted_at
+        try:
+            return function(*args)
+        finally:
+            with _stats_lock:
+                _stats["running"] -= 1
+                _stats["completed"] += 1
+                _stats["runSeconds"] += time.monotonic() - started_at
+
+    # Only this greenlet waits for the result
+    return pool.spawn(run).get()
+
+
+def getPasswordHashStats():
+    """Queue depth and timings of the password threadpool of this process"""
+    pool = _getPasswordPool()
+    with _stats_lock:
+        stats = dict(_stats)
+    completed = stats["completed"] or 1
+    return {
+        "threads": pool.maxsize if pool is not None else 0,
+        "queued": stats["queued"],
+        "running": stats["running"],
+        "peakQueued": stats["peakQueued"],
+        "completed": stats["completed"],
+        "avgWaitMs": round(stats["waitSeconds"] * 1000 / completed, 2),
+        "avgRunMs": round(stats["runSeconds"] * 1000 / completed, 2),
+    }
+
 
 def hashPassword(password):
-    return bcrypt.generate_password_hash(password, 10).decode('utf-8')
+    return _runPasswordOperation(
+        bcrypt.generate_password_hash, password, 10
+    ).decode('utf-8')
 
 
 def checkPasswordHash(pw_hash, password):
-    return bcrypt.check_password_hash(pw_hash, password)
+    return _runPasswordOperation(bcrypt.check_password_hash, pw_hash, password)
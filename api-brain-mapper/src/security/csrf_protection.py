@@ -1,15 +1,28 @@
 import secrets
 import hashlib
+import hmac
 import time
+import threading
+from collections import OrderedDict
 from functools import wraps
 from flask import request, session, abort, current_app
 
+# Prefix of tokens signed with HMAC-SHA256. Tokens without it are the
+# legacy PBKDF2 ones, accepted while CSRF_ACCEPT_LEGACY_TOKENS is set and
+# only until they could have expired since the worker started.
+TOKEN_VERSION = 'v2'
+
 
 class CSRFProtection:
     """CSRF protection utilities"""
     
     def __init__(self, app=None):
         self.app = app
+        # Tokens whose signature was already verified, least recent first
+        self._verified_tokens = OrderedDict()
+        self._verified_tokens_lock = threading.Lock()
+        # No legacy token is issued after this, see _accepts_legacy_token
+        self._started_at = int(time.time())
         if app is not None:
             self.init_app(app)
     
@@ -17,6 +30,8 @@ class CSRFProtection:
         """Initialize CSRF protection with Flask app"""
         app.config.setdefault('CSRF_SECRET_KEY', secrets.token_hex(32))
         app.config.setdefault('CSRF_TOKEN_TIMEOUT', 3600)  # 1 hour
+        app.config.setdefault('CSRF_VERIFIED_CACHE_SIZE', 10000)
+        app.config.setdefault('CSRF_ACCEPT_LEGACY_TOKENS', False)
         
         # Add before_request handler
         @app.before_request
@@ -91,12 +106,17 @@ class CSRFProtection:
             
             # Decode token parts
             parts = token.split('.')
-            if len(parts) != 3:
+            if len(parts) == 4 and parts[0] == TOKEN_VERSION:
+                _, timestamp_str, session_id, signature = parts
+                legacy = False
+            elif len(parts) == 3 and self._accepts_legacy_token(parts[0]):
+                timestamp_str, session_id, signature = parts
+                legacy = True
+            else:
                 if current_app.config.get('DEBUG'):
                     current_app.logger.debug("[CSRF DEBUG] Token has wrong number of parts")
                 return False
             
-            timestamp_str, session_id, signature = parts
             timestamp = int(timestamp_str)  # Use int instead of float
             
             if current_app.config.get('DEBUG'):
@@ -114,15 +134,26 @@ class CSRFProtection:
                     current_app.logger.debug("[CSRF DEBUG] Token expired")
                 return False
             
+            # Tokens are sent with every request, verify each one only once
+            if self._is_verified_token(token):
+                return True
+            
             # Verify signature
-            expected_signature = self._generate_csrf_signature(
-                timestamp_str, session_id
-            )
+            if legacy:
+                expected_signature = self._generate_legacy_csrf_signature(
+                    timestamp_str, session_id
+                )
+            else:
+                expected_signature = self._generate_csrf_signature(
+                    timestamp_str, session_id
+                )
             
             signature_match = secrets.compare_digest(signature, expected_signature)
             if current_app.config.get('DEBUG'):
                 current_app.logger.debug(f"[CSRF DEBUG] Signature match: {signature_match}")
             
+            if signature_match:
+                self._add_verified_token(token)
             return signature_match
             
         except (ValueError, TypeError, OverflowError) as e:
@@ -130,10 +161,49 @@ class CSRFProtection:
                 current_app.logger.debug(f"[CSRF DEBUG] Token parsing error: {e}")
             return False
     
+    def _accepts_legacy_token(self, timestamp_str):
+        """
+        Whether a legacy token may reach the slow PBKDF2 check. Only this
+        code's predecessor issued them, so only tokens older than the worker
+        are accepted, and none once CSRF_TOKEN_TIMEOUT has passed since it
+        started, when every legacy token has expired.
+        """
+        if not current_app.config.get('CSRF_ACCEPT_LEGACY_TOKENS'):
+            return False
+        timeout = current_app.config.get('CSRF_TOKEN_TIMEOUT', 3600)
+        if int(time.time()) > self._started_at + timeout:
+            return False
+        return int(timestamp_str) <= self._started_at
+    
+    def _is_verified_token(self, token):
+        """Whether the signature of the token was already verified"""
+        with self._verified_tokens_lock:
+            if token in self._verified_tokens:
+                self._verified_tokens.move_to_end(token)
+                return True
+        return False
+    
+    def _add_verified_token(self, token):
+        """Remember a token with a valid signature, evicting the least recent"""
+        max_size = current_app.config.get('CSRF_VERIFIED_CACHE_SIZE', 10000)
+        with self._verified_tokens_lock:
+            self._verified_tokens[token] = True
+            while len(self._verified_tokens) > max_size:
+                self._verified_tokens.popitem(last=False)
+    
     def _generate_csrf_signature(self, timestamp_str, session_id):
         """Generate CSRF token signature"""
         secret_key = current_app.config['CSRF_SECRET_KEY']
         
+        data = f"{TOKEN_VERSION}.{timestamp_str}.{session_id}".encode('utf-8')
+        return hmac.new(
+            secret_key.encode('utf-8'), data, hashlib.sha256
+        ).hexdigest()
+    
+    def _generate_legacy_csrf_signature(self, timestamp_str, session_id):
+        """Signature of the tokens issued before TOKEN_VERSION"""
+        secret_key = current_app.config['CSRF_SECRET_KEY']
+        
         # Create signature using HMAC
         data = f"{timestamp_str}.{session_id}".encode('utf-8')
         signature = hashlib.pbkdf2_hmac(
@@ -158,7 +228,7 @@ class CSRFProtection:
         timestamp_str = str(int(time.time()))
         signature = self._generate_csrf_signature(timestamp_str, session_id)
         
-        token = f"{timestamp_str}.{session_id}.{signature}"
+        token = f"{TOKEN_VERSION}.{timestamp_str}.{session_id}.{signature}"
         if current_app.config.get('DEBUG'):
             current_app.logger.debug(f"[CSRF DEBUG] Generated token: {token[:20]}...")
             current_app.logger.debug(f"[CSRF DEBUG] Token timestamp: {timestamp_str}")
@@ -1,11 +1,8 @@
 from functools import wraps
 from flask import request, abort, g
 from werkzeug.exceptions import HTTPException
-from sqlalchemy import select
 from ..security.jwt_utils import decode_auth_jwt
-from ..models.user import User
-from ..schemas.user import user_schema
-from ..database.dbConnection import db
+from ..security.user_cache import get_authenticated_user
 
 
 def auth_required(requiredRoles=None):
@@ -43,28 +40,26 @@ def auth_required(requiredRoles=None):
                     else:
                         abort(401, "UNAUTHORIZED: Token validation failed")
 
-            # Check if user exists
+            # Check if user exists, cached per worker for active users
             try:
-                stmt = select(User).where(User.id == uid)
-                result = db.session.execute(statement=stmt)
-                user = result.scalar_one_or_none()
-
-                if user is None:
-                    abort(401, "UNAUTHORIZED: User not found")
+                user = get_authenticated_user(uid)
             except Exception:
                 abort(500, "INTERNAL ERROR: Database error")
 
+            if user is None:
+                abort(401, "UNAUTHORIZED: User not found")
+
             # Store the uid, role, and user info in g so it's accessible
             # throughout the request
             g.uid = uid
-            g.role = user.role.name
+            g.role = user.role
             g.user_name = user.name
             g.user_last_name = user.lastName
             g.user_email = user.email
 
             # Check role permissions if required
             if requiredRoles is not None:
-                if user.role.name not in requiredRoles:
+                if user.role not in requiredRoles:
                     required_roles_str = ", ".join(requiredRoles)
                     error_msg = f"FORBIDDEN: Required role(s): {required_roles_str}"
                     abort(403, error_msg)
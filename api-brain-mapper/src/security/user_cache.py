@@ -0,0 +1,58 @@
+import time
+import threading
+from collections import OrderedDict, namedtuple
+from flask import current_app
+from sqlalchemy import select
+from ..models.user import User
+from ..models.role import Role
+from ..database.dbConnection import db
+
+CachedUser = namedtuple("CachedUser", ["id", "role", "name", "lastName", "email"])
+
+# Authenticated users of this worker process: uid -> (expires at, CachedUser)
+_users = OrderedDict()
+_users_lock = threading.Lock()
+
+
+def get_authenticated_user(uid):
+    """
+    Get the id, role name, name and email of a user, cached for
+    AUTH_USER_CACHE_TTL seconds so authenticated requests of active users
+    don't query the DB. Changes made through invalidate_user() are seen at
+    once by this worker, and by the other workers when the entry expires.
+    :return: CachedUser, None if the user doesn't exist
+    """
+    ttl = current_app.config.get("AUTH_USER_CACHE_TTL", 30)
+    now = time.monotonic()
+
+    with _users_lock:
+        entry = _users.get(uid)
+        if entry is not None:
+            if entry[0] > now:
+                _users.move_to_end(uid)
+                return entry[1]
+            del _users[uid]
+
+    # User and role in a single query
+    row = db.session.execute(
+        select(User.id, Role.name, User.name, User.lastName, User.email)
+        .join(Role, User.roleId == Role.id)
+        .where(User.id == uid)
+    ).first()
+    if row is None:
+        return None
+
+    user = CachedUser(*row)
+    if ttl > 0:
+        with _users_lock:
+            _users[uid] = (now + ttl, user)
+            _users.move_to_end(uid)
+            while len(_users) > current_app.config.get("AUTH_USER_CACHE_SIZE", 10000):
+                _users.popitem(last=False)
+    return user
+
+
+def invalidate_user(uid):
+    """Drop a user from the cache after its role, profile or account changed"""
+    with _users_lock:
+        _users.pop(uid, None)
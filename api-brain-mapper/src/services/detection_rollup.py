@@ -0,0 +1,103 @@
+from collections import defaultdict
+from sqlalchemy import update, delete
+from sqlalchemy.dialects.postgresql import insert
+from ..database.dbConnection import db
+from ..models.daily_detection_count import DailyDetectionCount
+from ..models.daily_inference_count import DailyInferenceCount
+
+
+def add_to_daily_rollups(entries):
+    """
+    Add summarized inferences to the daily rollups.
+    :param entries: iterable of (inference, summary) pairs, where summary is
+                    the output of summarize_detections
+    The caller is responsible for committing the session, so the rollups
+    are updated in the same transaction as the inferences.
+    """
+    inference_totals = defaultdict(lambda: {'inferenceCount': 0, 'totalDetections': 0})
+    class_totals = defaultdict(int)
+
+    for inference, summary in entries:
+        key = (inference.userId, inference.createdOn.date(), inference.modelId)
+        inference_totals[key]['inferenceCount'] += 1
+        inference_totals[key]['totalDetections'] += summary['totalDetections']
+        for class_id, count in summary['classCounts'].items():
+            class_totals[key + (class_id,)] += count
+
+    if inference_totals:
+        stmt = insert(DailyInferenceCount)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['userId', 'day', 'modelId'],
+            set_={
+                'inferenceCount': DailyInferenceCount.inferenceCount + stmt.excluded.inferenceCount,
+                'totalDetections': DailyInferenceCount.totalDetections + stmt.excluded.totalDetections,
+            }
+        )
+        db.session.execute(stmt, [
+            {'userId': user_id, 'day': day, 'modelId': model_id, **totals}
+            for (user_id, day, model_id), totals in inference_totals.items()
+        ])
+
+    if class_totals:
+        stmt = insert(DailyDetectionCount)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['userId', 'day', 'modelId', 'classId'],
+            set_={'count': DailyDetectionCount.count + stmt.excluded.count}
+        )
+        db.session.execute(stmt, [
+            {'userId': user_id, 'day': day, 'modelId': model_id,
+             'classId': class_id, 'count': count}
+            for (user_id, day, model_id, class_id), count in class_totals.items()
+        ])
+
+
+def remove_from_daily_rollups(inference):
+    """
+    Subtract a summarized inference from the daily rollups before it is
+    deleted. The caller is responsible for committing the session.
+    """
+    if inference.totalDetections is None:
+        return  # Never added to the rollups
+
+    day = inference.createdOn.date()
+
+    db.session.execute(
+        update(DailyInferenceCount)
+        .where(
+            DailyInferenceCount.userId == inference.userId,
+            DailyInferenceCount.day == day,
+            DailyInferenceCount.modelId == inference.modelId
+        )
+        .values(
+            inferenceCount=DailyInferenceCount.inferenceCount - 1,
+            totalDetections=DailyInferenceCount.totalDetections - inference.totalDetections
+        )
+    )
+    db.session.execute(
+        delete(DailyInferenceCount).where(
+            DailyInferenceCount.userId == inference.userId,
+            DailyInferenceCount.day == day,
+            DailyInferenceCount.modelId == inference.modelId,
+            DailyInferenceCount.inferenceCount <= 0
+        )
+    )
+
+    for class_count in inference.classCounts:
+        db.session.execute(
+            update(DailyDetectionCount)
+            .where(
+                DailyDetectionCount.userId == inference.userId,
+                DailyDetectionCount.day == day,
+                DailyDetectionCount.modelId == inference.modelId,
+                DailyDetectionCount.classId == class_count.classId
+            )
+            .values(count=DailyDetectionCount.count - class_count.count)
+        )
+    db.session.execute(
+        delete(DailyDetectionCount).where(
+            DailyDetectionCount.userId == inference.userId,
+            DailyDetectionCount.day == day,
+            DailyDetectionCount.modelId == inference.modelId,
+            DailyDetectionCount.count <= 0
+        )
+    )
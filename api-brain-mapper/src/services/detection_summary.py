@@ -0,0 +1,245 @@
+import os
+import json
+from collections import defaultdict
+from sqlalchemy import insert
+from minio.error import S3Error
+from logs.logger import logger
+from ..cloudServices.minioConnections import getMinioClient
+from ..database.dbConnection import db
+from ..models.inference import Inference
+from ..models.inference_class_count import InferenceClassCount
+from ..models.detection import Detection
+from .detection_rollup import add_to_daily_rollups
+
+
+def summarize_detections(detections):
+    """
+    Build the per-inference detection summary from the NN API detections list.
+    Returns a dict with totalDetections, confidence stats and classCounts.
+    """
+    class_counts = defaultdict(int)
+    confidences = []
+
+    for detection in detections or []:
+        class_id = detection.get('class_id')
+        if class_id is None:
+            continue
+        class_counts[int(class_id)] += 1
+
+        confidence = detection.get('confidence')
+        if confidence is not None:
+            confidences.append(float(confidence))
+
+    return {
+        'totalDetections': sum(class_counts.values()),
+        'meanConfidence': (sum(confidences) / len(confidences)
+                           if confidences else None),
+        'minConfidence': min(confidences) if confidences else None,
+        'maxConfidence': max(confidences) if confidences else None,
+        'classCounts': dict(class_counts),
+    }
+
+
+def apply_detection_summary(inference, metadata):
+    """
+    Store the detection summary of `metadata` on the inference record.
+    The caller is responsible for committing the session.
+    """
+    summary = summarize_detections(metadata.get('detections', []))
+
+    inference.totalDetections = summary['totalDetections']
+    inference.meanConfidence = summary['meanConfidence']
+    inference.minConfidence = summary['minConfidence']
+    inference.maxConfidence = summary['maxConfidence']
+    inference.classCounts = [
+        InferenceClassCount(classId=class_id, count=count)
+        for class_id, count in summary['classCounts'].items()
+    ]
+
+    return summary
+
+
+def parse_bbox(bbox):
+    """Get (x1, y1, x2, y2) from a bbox given as a list or as a dict"""
+    try:
+        if isinstance(bbox, (list, tuple)) and len(bbox) == 4:
+            return tuple(float(value) for value in bbox)
+        if isinstance(bbox, dict):
+            return tuple(float(bbox[key]) for key in ('x1', 'y1', 'x2', 'y2'))
+    except (KeyError, TypeError, ValueError):
+        pass
+    return (None, None, None, None)
+
+
+def build_detection_rows(inference, detections):
+    """Build one `detections` row per detection of the inference"""
+    rows = []
+    for detection in detections or []:
+        class_id = detection.get('class_id')
+        if class_id is None:
+            continue
+
+        x1, y1, x2, y2 = parse_bbox(detection.get('bbox'))
+        confidence = detection.get('confidence')
+        rows.append({
+            'inferenceId': inference.id,
+            'userId': inference.userId,
+            'modelId': inference.modelId,
+            'createdOn': inference.createdOn,
+            'classId': int(class_id),
+            'confidence': float(confidence) if confidence is not None else None,
+            'bboxX1': x1,
+            'bboxY1': y1,
+            'bboxX2': x2,
+            'bboxY2': y2,
+        })
+    return rows
+
+
+def insert_detections(inference, detections):
+    """
+    Bulk insert the detections of an inference in a single executemany.
+    The inference must already be flushed so it has an id. The caller is
+    responsible for committing the session.
+    """
+    rows = build_detection_rows(inference, detections)
+    if rows:
+        db.session.execute(insert(Detection), rows)
+    return len(rows)
+
+
+def record_detections(entries):
+    """
+    Store everything derived from the NN API metadata of many inferences:
+    the summaries, one row per detection and their share of the daily
+    rollups, with a single flush and one executemany per table.
+    :param entries: list of (inference, metadata) pairs, the inferences
+                    must be in the session
+    The caller is responsible for committing, so all of it lands in the
+    same transaction as the inferences.
+    """
+    summaries = [
+        apply_detection_summary(inference, metadata)
+        for inference, metadata in entries
+    ]
+    db.session.flush()  # Assigns the ids referenced by the detection rows
+
+    detection_rows = []
+    for inference, metadata in entries:
+        detection_rows.extend(
+            build_detection_rows(inference, metadata.get('detections', []))
+        )
+    if detection_rows:
+        db.session.execute(insert(Detection), detection_rows)
+
+    add_to_daily_rollups([
+        (inference, summary)
+        for (inference, _), summary in zip(entries, summaries)
+    ])
+    return summaries
+
+
+def record_inference_detections(inference, metadata):
+    """Store the summary, detections and rollups of a single inference"""
+    return record_detections([(inference, metadata)])[0]
+
+
+def get_metadata_object_key(inference):
+    """Get the MinIO key of the metadata.json stored next to the result image"""
+    if not inference.generatedImageUrl:
+        return None
+
+    url_parts = inference.generatedImageUrl.split("/")
+    if len(url_parts) < 2:
+        return None
+
+    return f"{inference.userId}/{url_parts[-2]}/metadata.json"
+
+
+def mark_summary_failed(inference):
+    """
+    Store an empty summary for an inference whose metadata is missing or
+    malformed, flagged so it can be told apart from an inference without
+    detections. It is not downloaded again on every dashboard load.
+    """
+    record_inference_detections(inference, {'detections': []})
+    inference.summaryFailed = True
+
+
+def summarize_pending_inferences(user_id):
+    """
+    Summarize inferences created before summaries were persisted.
+    Each legacy inference is read from MinIO only once, afterwards it is
+    answered from the database like any new inference.
+    Every inference is saved in its own SAVEPOINT, so one that fails to
+    save doesn't discard the others.
+    """
+    pending = Inference.query.filter(
+        Inference.userId == user_id,
+        Inference.totalDetections.is_(None),
+        Inference.generatedImageUrl.isnot(None)
+    ).all()
+
+    if not pending:
+        return 0
+
+    minioClient = getMinioClient()
+    s3Bucket = os.getenv("S3_BUCKET_INFERENCES_RESULTS")
+
+    summarized = 0
+    for inference in pending:
+        metadata_object_key = get_metadata_object_key(inference)
+        if not metadata_object_key:
+            continue
+
+        try:
+            response = minioClient.get_object(s3Bucket, metadata_object_key)
+            try:
+                metadata_content = response.read()
+            finally:
+                response.close()
+                response.release_conn()
+            metadata = json.loads(metadata_content.decode('utf-8'))
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                logger.warning(f"Could not read metadata for inference {inference.id}: {str(e)}")
+                continue
+            metadata = None
+        except ValueError:  # Not JSON or not UTF-8
+            metadata = None
+        except Exception as e:
+            # e.g. MinIO unreachable, retried on the next load
+            logger.warning(f"Could not read metadata for inference {inference.id}: {str(e)}")
+            continue
+
+        try:
+            if metadata is not None:
+                try:
+                    with db.session.begin_nested():
+                        record_inference_detections(inference, metadata)
+                    summarized += 1
+                    continue
+                except (AttributeError, TypeError, ValueError):
+                    pass  # Malformed detections
+
+            logger.warning(
+                f"Metadata of inference {inference.id} is missing or malformed, "
+                f"storing an empty summary"
+            )
+            with db.session.begin_nested():
+                mark_summary_failed(inference)
+            summarized += 1
+        except Exception as e:
+            logger.warning(f"Could not summarize metadata for inference {inference.id}: {str(e)}")
+            continue
+
+    if summarized:
+        try:
+            db.session.commit()
+            logger.info(f"Summarized {summarized} legacy inferences for user {user_id}")
+        except Exception:
+            logger.exception(f"Error saving detection summaries for user {user_id}")
+            db.session.rollback()
+            return 0
+
+    return summarized
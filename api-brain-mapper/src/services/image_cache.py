@@ -0,0 +1,257 @@
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from flask import current_app
+from logs.logger import logger
+
+_image_cache = None
+_image_cache_lock = threading.Lock()
+
+
+def get_image_cache():
+    """Image cache of this process, configured from the app config"""
+    global _image_cache
+
+    with _image_cache_lock:
+        if _image_cache is None:
+            config = current_app.config
+            _image_cache = ImageCache(
+                memory_bytes=config.get("IMAGE_CACHE_MEMORY_BYTES", 0),
+                memory_item_bytes=config.get("IMAGE_CACHE_MEMORY_ITEM_BYTES", 0),
+                disk_dir=config.get("IMAGE_CACHE_DIR"),
+                disk_bytes=config.get("IMAGE_CACHE_DISK_BYTES", 0),
+            )
+        return _image_cache
+
+
+class ImageCache:
+    """
+    Two-tier LRU cache of immutable MinIO objects.
+    - Memory: small objects of this process, up to memory_bytes
+    - Disk: objects of every worker under disk_dir, up to disk_bytes,
+      mirroring the bucket and object key so a folder can be invalidated.
+      Files are served with sendfile, and hits refresh their mtime for LRU.
+    Objects never change once stored, so entries only go away by eviction
+    or by invalidating the folder of a deleted inference.
+    """
+
+    def __init__(self, memory_bytes, memory_item_bytes, disk_dir, disk_bytes):
+        self.memory_bytes = memory_bytes
+        self.memory_item_bytes = memory_item_bytes
+        self.disk_dir = disk_dir if disk_dir and disk_bytes > 0 else None
+        self.disk_bytes = disk_bytes
+
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._disk_used = None  # Unknown until the directory is scanned
+        self._lock = threading.Lock()
+
+        self.stats = {"memoryHits": 0, "diskHits": 0, "misses": 0, "evictions": 0}
+
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+    def _get_path(self, bucket, object_key):
+        if ".." in object_key.split("/") or object_key.startswith("/"):
+            raise ValueError(f"Invalid object key {object_key}")
+        return os.path.join(self.disk_dir, bucket, object_key)
+
+    def get(self, bucket, object_key):
+        """
+        :return: (bytes, None) on a memory hit, (None, open file) on a disk
+                 hit, (None, None) on a miss
+        """
+        key = (bucket, object_key)
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.stats["memoryHits"] += 1
+                return data, None
+
+        if self.disk_dir:
+            path = self._get_path(bucket, object_key)
+            try:
+                # Opened right away so an eviction can't remove it before
+                # it is sent
+                file = open(path, "rb")
+            except OSError:
+                file = None
+            if file is not None:
+                try:
+                    os.utime(path)  # Most recently used
+                except OSError:
+                    pass  # Evicted meanwhile, the open file is still served
+            if file is not None:
+                with self._lock:
+                    self.stats["diskHits"] += 1
+                if os.fstat(file.fileno()).st_size <= self.memory_item_bytes:
+                    self.put_memory(bucket, object_key, file.read())
+                    file.seek(0)
+                return None, file
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None, None
+
+    def put_memory(self, bucket, object_key, data):
+        if len(data) > self.memory_item_bytes:
+            return
+        key = (bucket, object_key)
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = data
+            self._memory_used += len(data)
+            while self._memory_used > self.memory_bytes and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_used -= len(evicted)
+                self.stats["evictions"] += 1
+
+    def writer(self, bucket, object_key, size):
+        """
+        Writer to fill the cache while the object is streamed to a client,
+        None if the object does not fit in any tier
+        """
+        fits_memory = size <= self.memory_item_bytes
+        fits_disk = self.disk_dir is not None and size <= self.disk_bytes
+        if not fits_memory and not fits_disk:
+            return None
+        return ImageCacheWriter(self, bucket, object_key, fits_memory, fits_disk)
+
+    def commit_disk(self, tmp_path, bucket, object_key):
+        path = self._get_path(bucket, object_key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._disk_used is not None:
+                self._disk_used += size
+            must_evict = self._disk_used is None or self._disk_used > self.disk_bytes
+        if must_evict:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        """
+        Remove the least recently used files until the directory is under
+        90% of its budget. The directory is scanned since every worker
+        writes to it.
+        """
+        files = []
+        for root, _, names in os.walk(self.disk_dir):
+            for name in names:
+                if name.startswith(".tmp-"):
+                    continue  # Still being written
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+
+        used = sum(size for _, size, _ in files)
+        target = self.disk_bytes * 0.9
+        evicted = 0
+        if used > self.disk_bytes:
+            for _, size, path in sorted(files):
+                if used <= target:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                used -= size
+                evicted += 1
+
+        with self._lock:
+            self._disk_used = used
+            self.stats["evictions"] += evicted
+
+    def invalidate_prefix(self, bucket, prefix):
+        """Remove every cached object under a folder, e.g. of a deleted inference"""
+        with self._lock:
+            for key in [k for k in self._memory if k[0] == bucket and k[1].startswith(prefix)]:
+                self._memory_used -= len(self._memory.pop(key))
+
+        if self.disk_dir:
+            path = self._get_path(bucket, prefix.rstrip("/"))
+            shutil.rmtree(path, ignore_errors=True)
+            with self._lock:
+                self._disk_used = None  # Scanned again on the next write
+
+    def getStats(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "memoryEntries": len(self._memory),
+                "memoryBytes": self._memory_used,
+                "diskBytes": self._disk_used,
+            }
+
+
+class ImageCacheWriter:
+    """
+    Receives the chunks of an object streamed from MinIO and stores it in
+    the cache only once the whole object was received.
+    """
+
+    def __init__(self, cache, bucket, object_key, fits_memory, fits_disk):
+        self.cache = cache
+        self.bucket = bucket
+        self.object_key = object_key
+        self.chunks = [] if fits_memory else None
+        self.tmp_path = None
+        self.file = None
+
+        if fits_disk:
+            self.tmp_path = os.path.join(cache.disk_dir, f".tmp-{uuid.uuid4().hex}")
+            try:
+                self.file = open(self.tmp_path, "wb")
+            except OSError:
+                logger.exception(f"Error caching {self.object_key} on disk")
+                self._drop_disk()
+
+    def write(self, chunk):
+        if self.chunks is not None:
+            self.chunks.append(chunk)
+        if self.file:
+            try:
+                self.file.write(chunk)
+            except OSError:
+                # e.g. disk full, the client still gets the whole object
+                logger.exception(f"Error caching {self.object_key} on disk")
+                self._drop_disk()
+
+    def _drop_disk(self):
+        """Stop caching the object on disk, the memory tier is kept"""
+        if self.file:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+        if self.tmp_path:
+            try:
+                os.remove(self.tmp_path)
+            except OSError:
+                pass
+            self.tmp_path = None
+
+    def commit(self):
+        try:
+            if self.chunks is not None:
+                self.cache.put_memory(self.bucket, self.object_key, b"".join(self.chunks))
+            if self.file:
+                self.file.close()
+                self.file = None
+                self.cache.commit_disk(self.tmp_path, self.bucket, self.object_key)
+        except OSError:
+            logger.exception(f"Error caching {self.object_key}")
+            self.abort()
+
+    def abort(self):
+        self.chunks = None
+        self._drop_disk()
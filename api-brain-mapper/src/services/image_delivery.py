@@ -0,0 +1,206 @@
+import os
+import time
+import hashlib
+import threading
+import datetime
+from collections import OrderedDict
+from flask import Response
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.wsgi import wrap_file
+from logs.logger import logger
+
+# Bytes read from MinIO and sent to the client at a time
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Presigned URLs of this process per (bucket, object key, TTL window)
+PRESIGNED_URL_CACHE_SIZE = 10000
+_presigned_urls = OrderedDict()
+_presigned_urls_lock = threading.Lock()
+
+
+class ObjectStream:
+    """
+    Iterable of the chunks of a MinIO object, used as a response body.
+    Only one chunk is held in memory at a time. The WSGI server calls
+    close() when the response ends, fails or the client disconnects, which
+    returns the MinIO connection to the pool.
+    :param cache_writer: ImageCacheWriter receiving the chunks, the object
+                         is cached only if it is streamed completely
+    """
+
+    def __init__(self, minio_response, object_key, chunk_size=STREAM_CHUNK_SIZE,
+                 cache_writer=None):
+        self.minio_response = minio_response
+        self.object_key = object_key
+        self.chunk_size = chunk_size
+        self.cache_writer = cache_writer
+        self.closed = False
+
+    def __iter__(self):
+        try:
+            for chunk in self.minio_response.stream(self.chunk_size):
+                if self.cache_writer:
+                    self.cache_writer.write(chunk)
+                yield chunk
+            if self.cache_writer:
+                self.cache_writer.commit()
+                self.cache_writer = None
+        except Exception:
+            logger.exception(f"Error streaming {self.object_key} from MinIO")
+            raise
+        finally:
+            self.close()
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            if self.cache_writer:
+                self.cache_writer.abort()
+            self.minio_response.close()
+            self.minio_response.release_conn()
+
+
+def open_object_stream(minioClient, bucket, object_key, chunk_size=STREAM_CHUNK_SIZE,
+                       cache_writer=None):
+    """
+    Start reading a MinIO object. The request is sent right away so a
+    missing object raises here, before any response header is sent.
+    """
+    return ObjectStream(
+        minioClient.get_object(bucket, object_key), object_key, chunk_size,
+        cache_writer
+    )
+
+
+def get_object_etag(bucket, object_key):
+    """
+    Strong ETag of a MinIO object. Objects are never overwritten, so the
+    key identifies the content and no MinIO request is needed.
+    """
+    return hashlib.sha256(f"{bucket}/{object_key}".encode()).hexdigest()[:32]
+
+
+def _make_conditional(response, request, etag, size):
+    """Answer the range requests of a cached object"""
+    response.set_etag(etag)
+    try:
+        return response.make_conditional(
+            request, accept_ranges=True, complete_length=size
+        )
+    except RequestedRangeNotSatisfiable:
+        response.close()
+        response = Response(status=416, headers={"Accept-Ranges": "bytes"})
+        response.headers["Content-Range"] = f"bytes */{size}"
+        return response
+
+
+def build_object_response(minioClient, bucket, object_key, request, mimetype,
+                          headers=None, cache=None):
+    """
+    Stream a MinIO object answering conditional and range requests.
+    - If-None-Match with the current ETag: 304 without reading the object
+    - A single satisfiable byte range: 206 with only those bytes
+    - An unsatisfiable range: 416
+    Anything else sends the whole object.
+    :param cache: ImageCache serving the object if it holds it, and filled
+                  when the whole object is streamed from MinIO
+    """
+    etag = get_object_etag(bucket, object_key)
+    headers = {**(headers or {}), "Accept-Ranges": "bytes"}
+
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    if cache:
+        data, file = cache.get(bucket, object_key)
+        if data is not None:
+            response = Response(data, mimetype=mimetype, headers=headers)
+            return _make_conditional(response, request, etag, len(data))
+        if file is not None:
+            # sendfile through the WSGI server file wrapper
+            size = os.fstat(file.fileno()).st_size
+            response = Response(
+                wrap_file(request.environ, file), mimetype=mimetype,
+                headers=headers, direct_passthrough=True,
+            )
+            response.headers["Content-Length"] = str(size)
+            return _make_conditional(response, request, etag, size)
+
+    stat = minioClient.stat_object(bucket, object_key)
+
+    # Multiple ranges and If-Range dates are not supported, so they get the
+    # whole object, as does an If-Range with an outdated ETag
+    byte_range = request.range
+    if byte_range and (
+        len(byte_range.ranges) != 1
+        or request.if_range.date is not None
+        or (request.if_range.etag and request.if_range.etag != etag)
+    ):
+        byte_range = None
+
+    if byte_range:
+        content_range = byte_range.make_content_range(stat.size)
+        if content_range is None:
+            response = Response(status=416, headers=headers)
+            response.headers["Content-Range"] = f"bytes */{stat.size}"
+            return response
+
+        start, stop = content_range.start, content_range.stop
+        stream = ObjectStream(
+            minioClient.get_object(bucket, object_key, offset=start, length=stop - start),
+            object_key,
+        )
+        response = Response(
+            stream, status=206, mimetype=mimetype, headers=headers,
+            direct_passthrough=True,
+        )
+        response.headers["Content-Range"] = content_range.to_header()
+        response.headers["Content-Length"] = str(stop - start)
+    else:
+        cache_writer = cache.writer(bucket, object_key, stat.size) if cache else None
+        response = Response(
+            open_object_stream(minioClient, bucket, object_key, cache_writer=cache_writer),
+            mimetype=mimetype, headers=headers, direct_passthrough=True,
+        )
+        response.headers["Content-Length"] = str(stat.size)
+
+    response.set_etag(etag)
+    return response
+
+
+def get_presigned_object_url(minioClient, bucket, object_key, expiration):
+    """
+    Presigned GET URL of a MinIO object, cached per TTL window.
+    Windows last half the expiration and URLs are signed as of the start of
+    their window, so a URL is identical for every request and worker in a
+    window, and stays valid at least expiration / 2 seconds after it ends.
+    :return: (url, seconds until the window ends)
+    """
+    window_seconds = max(1, expiration // 2)
+    now = time.time()
+    window = int(now // window_seconds)
+    seconds_left = int((window + 1) * window_seconds - now)
+    key = (bucket, object_key, window)
+
+    with _presigned_urls_lock:
+        url = _presigned_urls.get(key)
+        if url is not None:
+            _presigned_urls.move_to_end(key)
+            return url, seconds_left
+
+    url = minioClient.presigned_get_object(
+        bucket,
+        object_key,
+        expires=datetime.timedelta(seconds=expiration),
+        request_date=datetime.datetime.fromtimestamp(
+            window * window_seconds, datetime.timezone.utc
+        ),
+    )
+
+    with _presigned_urls_lock:
+        _presigned_urls[key] = url
+        while len(_presigned_urls) > PRESIGNED_URL_CACHE_SIZE:
+            _presigned_urls.popitem(last=False)
+    return url, seconds_left
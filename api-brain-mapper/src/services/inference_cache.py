@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from minio.commonconfig import CopySource
+from minio.error import S3Error
+from sqlalchemy import select, func
+from logs.logger import logger
+from ..database.dbConnection import db
+from ..models.inference import Inference
+from .inference_pipeline import get_inference_object_keys, remove_uploaded_objects
+from .thumbnails import get_thumbnail_key
+
+
+def hash_image(image_data):
+    """Content address of an uploaded image"""
+    return hashlib.sha256(image_data).hexdigest()
+
+
+def find_cached_inference(user_id, model, image_hash):
+    """
+    Get a previous inference of the same image with the same model.
+    Results generated before the model was last updated are stale.
+    Only the user's own inferences are reused, so whether an image was
+    uploaded by someone else can't be inferred from the response.
+    """
+    query = Inference.query.filter(
+        Inference.userId == user_id,
+        Inference.imageHash == image_hash,
+        Inference.modelId == model.id,
+        Inference.generatedImageUrl.isnot(None)
+    )
+    if model.updatedOn:
+        query = query.filter(Inference.createdOn >= model.updatedOn)
+
+    return query.order_by(Inference.createdOn.desc()).first()
+
+
+def get_inference_lock_key(user_id, model_id, image_hash):
+    """64-bit advisory lock key of an inference request"""
+    digest = hashlib.sha256(f"{user_id}:{model_id}:{image_hash}".encode()).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+
+def lock_inference_requests(user_id, model_id, image_hashes, timeout,
+                            poll_interval=0.1):
+    """
+    Take the transaction level advisory locks of identical inference
+    requests. Every greenlet and gunicorn worker uses its own DB connection,
+    so the lock is shared by all of them and released on commit or rollback.
+    Locks are taken in key order so two batches can't deadlock.
+    :return: False if some lock could not be taken before the timeout
+    """
+    deadline = time.monotonic() + timeout
+    lock_keys = sorted({
+        get_inference_lock_key(user_id, model_id, image_hash)
+        for image_hash in image_hashes
+    })
+
+    for lock_key in lock_keys:
+        # try_lock and sleep, so the wait can give up after the timeout
+        while not db.session.execute(
+            select(func.pg_try_advisory_xact_lock(lock_key))
+        ).scalar():
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(poll_interval)
+    return True
+
+
+def find_or_lock_cached_inference(user_id, model, image_hash, timeout):
+    """
+    Single-flight cache lookup. On a miss, wait until no identical request
+    is in flight, then look again: the first request commits its inference
+    before releasing the lock, so the ones waiting reuse its results
+    instead of calling the NN API again.
+    :return: The cached inference, or None if the caller must run the
+             inference, holding the lock until it commits
+    """
+    cached_inference = find_cached_inference(user_id, model, image_hash)
+    if cached_inference:
+        return cached_inference
+
+    if not lock_inference_requests(user_id, model.id, [image_hash], timeout):
+        logger.warning(
+            f"Timed out waiting for identical inference of user {user_id} "
+            f"with model {model.id}, running it again"
+        )
+        return None
+    return find_cached_inference(user_id, model, image_hash)
+
+
+def copy_inference_objects(minioClient, source_inference, object_keys,
+                           copy_original=True, thumbnail_variants=()):
+    """
+    Copy the objects of a cached inference to the new inference folder.
+    Objects are copied server-side, so no bytes go through this worker,
+    and every inference keeps its own folder for deletes.
+    Thumbnails are copied too when the source has them. A thumbnail that
+    could not be copied is only logged, it is generated on first request.
+    :param copy_original: False when the original image is already stored
+    :param thumbnail_variants: (width, format) thumbnails pre-generated for
+                               the original and result images
+    :return: The metadata of the cached inference
+    """
+    s3Bucket = os.getenv("S3_BUCKET_INFERENCES_RESULTS")
+    source_folder = source_inference.generatedImageUrl.split("/")[-2]
+    source_keys = get_inference_object_keys(source_inference.userId, source_folder)
+
+    response = minioClient.get_object(s3Bucket, source_keys["metadata"])
+    try:
+        metadata = json.loads(response.read().decode("utf-8"))
+    finally:
+        response.close()
+        response.release_conn()
+
+    copy_stored_objects(
+        minioClient, source_keys, object_keys, copy_original, thumbnail_variants
+    )
+
+    logger.info(
+        f"Reused results of inference {source_inference.id} for {object_keys['original']}"
+    )
+    return metadata
+
+
+def copy_stored_objects(minioClient, source_keys, object_keys,
+                        copy_original=True, thumbnail_variants=()):
+    """
+    Copy the objects of an inference folder to another one, e.g. from an
+    inference of the same batch not saved yet. If a copy fails, the objects
+    already copied are removed before the error is raised.
+    :param copy_original: False when the original image is already stored
+    :param thumbnail_variants: (width, format) thumbnails pre-generated for
+                               the original and result images
+    """
+    s3Bucket = os.getenv("S3_BUCKET_INFERENCES_RESULTS")
+
+    def copy(kind):
+        minioClient.copy_object(
+            s3Bucket,
+            object_keys[kind],
+            CopySource(s3Bucket, source_keys[kind]),
+        )
+        return object_keys[kind]
+
+    def copy_thumbnail(kind, width, image_format):
+        thumbnail_key = get_thumbnail_key(object_keys[kind], width, image_format)
+        try:
+            minioClient.copy_object(
+                s3Bucket,
+                thumbnail_key,
+                CopySource(
+                    s3Bucket,
+                    get_thumbnail_key(source_keys[kind], width, image_format)
+                ),
+            )
+        except S3Error as e:
+            if e.code != "NoSuchKey":
+                raise
+            return None  # The source inference has no such thumbnail
+        return thumbnail_key
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        kinds = ["original", "result", "metadata"] if copy_original else ["result", "metadata"]
+        copies = [executor.submit(copy, kind) for kind in kinds]
+        thumbnail_copies = {
+            (kind, width, image_format): executor.submit(
+                copy_thumbnail, kind, width, image_format
+            )
+            for width, image_format in thumbnail_variants
+            for kind in ("original", "result")
+        }
+
+        copied = []
+        error = None
+        for future in copies:
+            try:
+                copied.append(future.result())
+            except Exception as e:
+                error = e
+
+        for (kind, width, image_format), future in thumbnail_copies.items():
+            try:
+                thumbnail_key = future.result()
+            except Exception:
+                logger.exception(
+                    f"Error copying {width}px {image_format} thumbnail "
+                    f"of {source_keys[kind]}"
+                )
+                continue
+            if thumbnail_key:
+                copied.append(thumbnail_key)
+
+    if error is not None:
+        if copied:
+            remove_uploaded_objects(minioClient, copied)
+        raise error
@@ -0,0 +1,148 @@
+import io
+import csv
+import json
+import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from logs.logger import logger
+from .detection_summary import parse_bbox
+from .inference_pipeline import get_object_key_from_url
+from .zip_streaming import ZipEntry
+
+DETECTIONS_CSV_HEADER = [
+    "inference_id", "inference_name", "created_on", "model_id",
+    "class_id", "confidence", "bbox_x1", "bbox_y1", "bbox_x2", "bbox_y2",
+]
+
+
+def _read_object(minioClient, bucket, object_key):
+    response = minioClient.get_object(bucket, object_key)
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def prefetch_objects(minioClient, bucket, object_keys, workers):
+    """
+    Read MinIO objects with a pool of workers, ahead of the consumer.
+    At most workers * 2 objects are downloaded or waiting in memory.
+    Yields (object key, bytes or the exception raised) in the given order.
+    """
+    object_keys = iter(object_keys)
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit_next():
+        object_key = next(object_keys, None)
+        if object_key is None:
+            return False
+        pending.append(
+            (object_key, executor.submit(_read_object, minioClient, bucket, object_key))
+        )
+        return True
+
+    try:
+        while len(pending) < workers * 2 and submit_next():
+            pass
+        while pending:
+            object_key, future = pending.popleft()
+            submit_next()
+            try:
+                yield object_key, future.result()
+            except Exception as e:
+                yield object_key, e
+    finally:
+        # The client may have disconnected, drop what is still queued
+        for _, future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def build_detections_rows(inference, metadata):
+    """Rows of the export detections CSV for one inference"""
+    rows = []
+    for detection in metadata.get("detections") or []:
+        class_id = detection.get("class_id")
+        if class_id is None:
+            continue
+        rows.append([
+            inference.id,
+            inference.name,
+            inference.createdOn.isoformat() if inference.createdOn else "",
+            inference.modelId,
+            int(class_id),
+            detection.get("confidence", ""),
+            *("" if value is None else value for value in parse_bbox(detection.get("bbox"))),
+        ])
+    return rows
+
+
+def build_export_entries(minioClient, bucket, inferences, workers):
+    """
+    Generator of the ZipEntry of an export: a folder per inference with its
+    images and metadata, then detections.csv with the detections of every
+    inference, built from the metadata while it is written, and a README.
+    Files missing from MinIO are skipped and listed in the README.
+    """
+    files = []
+    for inference in inferences:
+        prefix = f"inference_{inference.id}"
+        if not inference.baseImageUrl:
+            continue
+        base_object_key = get_object_key_from_url(inference.baseImageUrl)
+        files.append((inference, base_object_key,
+                      f"{prefix}/original_image_{inference.id}.jpg"))
+        if inference.generatedImageUrl:
+            files.append((inference, get_object_key_from_url(inference.generatedImageUrl),
+                          f"{prefix}/analyzed_image_{inference.id}.jpg"))
+        files.append((inference,
+                      "/".join(base_object_key.split("/")[:-1]) + "/metadata.json",
+                      f"{prefix}/analysis_metadata_{inference.id}.json"))
+
+    csv_buffer = io.StringIO()
+    csv_writer = csv.writer(csv_buffer)
+    csv_writer.writerow(DETECTIONS_CSV_HEADER)
+    missing = []
+
+    objects = prefetch_objects(
+        minioClient, bucket, (object_key for _, object_key, _ in files), workers
+    )
+    try:
+        for (inference, object_key, name), (_, data) in zip(files, objects):
+            if isinstance(data, Exception):
+                logger.warning(f"Export: could not read {object_key}: {str(data)}")
+                missing.append(name)
+                continue
+
+            if name.endswith(".json"):
+                try:
+                    csv_writer.writerows(build_detections_rows(inference, json.loads(data)))
+                except (ValueError, AttributeError):
+                    logger.warning(f"Export: invalid metadata {object_key}")
+
+            date_time = (inference.createdOn or datetime.datetime.now()).timetuple()[:6]
+            yield ZipEntry(name, [data], date_time, len(data))
+    finally:
+        objects.close()
+
+    now = datetime.datetime.now()
+    yield ZipEntry("detections.csv", [csv_buffer.getvalue().encode()], now.timetuple()[:6])
+
+    readme_content = f"""Exportación de Análisis - {len(inferences)} inferencias
+Generado el: {now}
+
+Archivos incluidos:
+- inference_<id>/original_image_<id>.jpg: La imagen original subida
+- inference_<id>/analyzed_image_<id>.jpg: Imagen con los objetos detectados resaltados
+- inference_<id>/analysis_metadata_<id>.json: Datos detallados del análisis
+- detections.csv: Todas las detecciones de las inferencias exportadas
+
+Este archivo ZIP fue generado por el sistema de análisis de IA NeuroBerry.
+"""
+    if missing:
+        readme_content += "\nArchivos no disponibles:\n" + "".join(
+            f"- {name}\n" for name in missing
+        )
+    yield ZipEntry("README.txt", [readme_content.encode()], now.timetuple()[:6])
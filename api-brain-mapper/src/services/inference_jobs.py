@@ -0,0 +1,336 @@
+import os
+import time
+import uuid
+import signal
+import datetime
+import threading
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import or_, and_, func, update
+from logs.logger import logger
+from ..cloudServices.minioConnections import getMinioClient
+from ..cloudServices.nnApiConnections import NnAPIClient
+from ..cloudServices.nnApiGuards import NnApiOverloadedError
+from ..database.dbConnection import db
+from ..models.inference_job import InferenceJob
+from ..models.model import Model
+from .inference_cache import (
+    hash_image,
+    find_or_lock_cached_inference,
+    copy_inference_objects,
+)
+from .thumbnails import get_pregenerated_variants
+from .inference_pipeline import (
+    get_inference_object_keys,
+    download_original_image,
+    run_inference,
+    create_inference_record,
+)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+
+def enqueue_inference_job(user_id, model_id, name, folder_name):
+    """
+    Add an inference job to the queue. The original image must already be
+    stored in the folder. The caller is responsible for committing.
+    """
+    job = InferenceJob(
+        userId=user_id,
+        modelId=model_id,
+        name=name,
+        folderName=folder_name,
+        status=JOB_QUEUED,
+        attempts=0,
+        createdOn=datetime.datetime.utcnow(),
+    )
+    db.session.add(job)
+    db.session.flush()  # Assigns the job id returned to the client
+    return job
+
+
+def get_queue_position(job):
+    """Number of queued jobs that will be claimed before this one"""
+    return InferenceJob.query.filter(
+        InferenceJob.status == JOB_QUEUED,
+        InferenceJob.id < job.id
+    ).count()
+
+
+def claim_next_job(lease_seconds, max_attempts=None):
+    """
+    Claim the oldest queued job, or a running one whose worker stopped
+    renewing it for longer than the lease. SKIP LOCKED lets every worker
+    claim a different job without waiting on each other.
+    Each claim gets a new claimToken, so a worker that lost its lease can't
+    finish a job claimed again by another one.
+    A stale job that already used max_attempts is failed instead of claimed
+    again, so a job that kills its worker (OOM, segfault) isn't retried
+    forever.
+    :return: (job, claim token), (None, None) if there is no job to run
+    """
+    while True:
+        now = datetime.datetime.utcnow()
+        stale_before = now - datetime.timedelta(seconds=lease_seconds)
+
+        job = InferenceJob.query.filter(
+            or_(
+                InferenceJob.status == JOB_QUEUED,
+                and_(InferenceJob.status == JOB_RUNNING,
+                     func.coalesce(InferenceJob.heartbeatOn,
+                                   InferenceJob.startedOn) < stale_before)
+            )
+        ).order_by(InferenceJob.id).with_for_update(skip_locked=True).first()
+
+        if job is None:
+            db.session.rollback()  # Ends the transaction holding no locks
+            return None, None
+
+        if (job.status == JOB_RUNNING and max_attempts is not None
+                and job.attempts >= max_attempts):
+            job.status = JOB_FAILED
+            job.finishedOn = now
+            job.claimToken = None
+            job.errorMessage = f"Worker lost the lease after {job.attempts} attempts"
+            logger.error(
+                f"Inference job {job.id} failed: worker lost the lease after "
+                f"{job.attempts} attempts"
+            )
+            db.session.commit()
+            continue
+        break
+
+    # Kept apart from the job, whose attributes are reloaded after commit
+    # and could then hold the token of a later claim
+    claim_token = uuid.uuid4().hex
+    job.status = JOB_RUNNING
+    job.startedOn = now
+    job.heartbeatOn = now
+    job.claimToken = claim_token
+    job.attempts += 1
+    db.session.commit()
+    return job, claim_token
+
+
+def _owned_job(job_id, claim_token):
+    """Condition matching a job only while this claim still holds it"""
+    return and_(InferenceJob.id == job_id,
+                InferenceJob.claimToken == claim_token,
+                InferenceJob.status == JOB_RUNNING)
+
+
+def renew_lease(engine, job_id, claim_token):
+    """
+    Push back the lease of a running job. Uses its own connection since it
+    runs next to the transaction of the job.
+    :return: False if the job is no longer held by this claim
+    """
+    with engine.begin() as connection:
+        result = connection.execute(
+            update(InferenceJob)
+            .where(_owned_job(job_id, claim_token))
+            .values(heartbeatOn=datetime.datetime.utcnow())
+        )
+    return result.rowcount == 1
+
+
+def start_lease_heartbeat(engine, job_id, claim_token, interval):
+    """
+    Renew the lease of a job every interval seconds until the returned
+    event is set
+    """
+    stopped = threading.Event()
+
+    def heartbeat():
+        while not stopped.wait(interval):
+            try:
+                if not renew_lease(engine, job_id, claim_token):
+                    logger.warning(f"Inference job {job_id} lease lost")
+                    return
+            except Exception:
+                logger.exception(f"Error renewing lease of inference job {job_id}")
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    return stopped
+
+
+def process_job(job, claim_token, nnClient):
+    """
+    Run the inference of a claimed job and create its Inference record.
+    :return: False if the lease was lost meanwhile, the inference record is
+             then discarded since the job belongs to another claim. Objects
+             are left in place: both claims write the same keys.
+    """
+    model = Model.query.get(job.modelId)
+    if not model:
+        raise ValueError(f"Model {job.modelId} not found")
+
+    minioClient = getMinioClient()
+    object_keys = get_inference_object_keys(job.userId, job.folderName)
+
+    logger.info(
+        f"Running inference job {job.id} for user {job.userId}: "
+        f"{object_keys['original']} with model {model.name}"
+    )
+
+    image_data = download_original_image(minioClient, object_keys)
+    image_hash = hash_image(image_data)
+
+    # Same image already analyzed with this model: reuse its results.
+    # An identical request in flight is waited for instead of repeated.
+    cached_inference = find_or_lock_cached_inference(
+        job.userId, model, image_hash,
+        current_app.config.get("INFERENCE_SINGLE_FLIGHT_TIMEOUT", 120)
+    )
+    if cached_inference:
+        metadata = copy_inference_objects(
+            minioClient, cached_inference, object_keys, copy_original=False,
+            thumbnail_variants=get_pregenerated_variants()
+        )
+    else:
+        metadata = run_inference(
+            nnClient, minioClient, image_data, model.name, object_keys,
+            upload_original=False,
+            thumbnail_variants=get_pregenerated_variants()
+        )
+
+    new_inference = create_inference_record(
+        job.userId, job.modelId, job.name, object_keys, metadata,
+        created_on=job.createdOn, image_hash=image_hash
+    )
+    db.session.flush()
+
+    result = db.session.execute(
+        update(InferenceJob)
+        .where(_owned_job(job.id, claim_token))
+        .values(status=JOB_COMPLETED,
+                inferenceId=new_inference.id,
+                finishedOn=datetime.datetime.utcnow())
+    )
+    if result.rowcount == 0:
+        db.session.rollback()
+        return False
+    db.session.commit()
+    return True
+
+
+def fail_job(job_id, claim_token, error, max_attempts):
+    """Put a job back in the queue, or fail it after max_attempts"""
+    db.session.rollback()
+    job = InferenceJob.query.filter(
+        _owned_job(job_id, claim_token)
+    ).with_for_update().first()
+    if job is None:
+        db.session.rollback()
+        return  # Claimed again by another worker
+
+    if job.attempts >= max_attempts:
+        job.status = JOB_FAILED
+        job.finishedOn = datetime.datetime.utcnow()
+        job.errorMessage = str(error)[:500]
+        logger.error(f"Inference job {job_id} failed after {job.attempts} attempts: {error}")
+    else:
+        job.status = JOB_QUEUED
+        logger.warning(f"Inference job {job_id} will be retried: {error}")
+    db.session.commit()
+
+
+def requeue_job(job_id, claim_token):
+    """Put back in the queue a job rejected unsent, without using an attempt"""
+    db.session.rollback()
+    job = InferenceJob.query.filter(
+        _owned_job(job_id, claim_token)
+    ).with_for_update().first()
+    if job is None:
+        db.session.rollback()
+        return  # Claimed again by another worker
+    job.status = JOB_QUEUED
+    job.attempts -= 1
+    db.session.commit()
+
+
+def run_inference_worker(poll_interval=1.0, lease_seconds=300, max_attempts=3):
+    """Claim and run inference jobs until SIGTERM or SIGINT"""
+    nnClient = NnAPIClient(
+        base_url=os.getenv("NN_API_HOST"),
+        secret_key=os.getenv("NN_API_SECRET_KEY"),
+    )
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        logger.info("Inference worker stopping after the current job")
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info(f"Inference worker {os.getpid()} started")
+    while not stopping:
+        try:
+            job, claim_token = claim_next_job(lease_seconds, max_attempts)
+        except Exception:
+            logger.exception("Error claiming inference job")
+            db.session.rollback()
+            time.sleep(poll_interval)
+            continue
+
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        job_id = job.id
+        heartbeat = start_lease_heartbeat(
+            db.engine, job_id, claim_token, max(1.0, lease_seconds / 3)
+        )
+        try:
+            try:
+                completed = process_job(job, claim_token, nnClient)
+            finally:
+                heartbeat.set()
+            if completed:
+                logger.info(f"Inference job {job_id} completed")
+            else:
+                logger.warning(
+                    f"Inference job {job_id} was claimed by another worker, "
+                    f"result discarded"
+                )
+        except NnApiOverloadedError as e:
+            # NN API is failing: wait for the circuit breaker instead of
+            # burning the attempts of every queued job
+            logger.warning(f"Inference job {job_id} postponed: {e}")
+            try:
+                requeue_job(job_id, claim_token)
+            except Exception:
+                logger.exception(f"Error updating inference job {job_id}")
+                db.session.rollback()
+            time.sleep(e.retry_after)
+        except Exception as e:
+            logger.exception(f"Error running inference job {job_id}")
+            try:
+                fail_job(job_id, claim_token, e, max_attempts)
+            except Exception:
+                logger.exception(f"Error updating inference job {job_id}")
+                db.session.rollback()
+        finally:
+            db.session.remove()
+
+
+@click.command("inference-worker")
+@click.option("--poll-interval", default=1.0, show_default=True,
+              help="Seconds to wait when the queue is empty.")
+@click.option("--lease", "lease_seconds", default=300, show_default=True,
+              help="Seconds without a heartbeat before a running job is retried.")
+@click.option("--max-attempts", default=3, show_default=True,
+              help="Attempts before a job is marked as failed.")
+@with_appcontext
+def inference_worker_command(poll_interval, lease_seconds, max_attempts):
+    """Run queued inference jobs."""
+    run_inference_worker(poll_interval=poll_interval,
+                         lease_seconds=lease_seconds,
+                         max_attempts=max_attempts)
@@ -0,0 +1,269 @@
+import os
+import re
+import json
+import time
+import datetime
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from minio.deleteobjects import DeleteObject
+from logs.logger import logger
+from ..database.dbConnection import db
+from ..models.inference import Inference
+from .detection_summary import record_inference_detections, record_detections
+from .thumbnails import upload_thumbnail, get_thumbnail_key
+
+
+def get_inference_object_keys(uid, folder_name):
+    """Get the MinIO keys of the objects stored for an inference"""
+    return {
+        "original": f"{uid}/{folder_name}/original_img.jpg",
+        "result": f"{uid}/{folder_name}/inference_result.jpg",
+        "metadata": f"{uid}/{folder_name}/metadata.json",
+    }
+
+
+def get_object_url(object_key):
+    """Get the URL stored in the DB for an object of the inferences bucket"""
+    s3Bucket = os.getenv("S3_BUCKET_INFERENCES_RESULTS")
+    s3LiveBaseUrl = os.getenv("S3_LIVE_BASE_URL") + s3Bucket
+    return f"{s3LiveBaseUrl}/{object_key}"
+
+
+def get_object_key_from_url(url):
+    """
+    Get the object key of an URL stored in the DB for the inferences bucket.
+    URLs stored with a local or internal MinIO host are accepted as well.
+    """
+    s3Bucket = os.getenv("S3_BUCKET_INFERENCES_RESULTS")
+    s3_live_base_url = os.getenv("S3_LIVE_BASE_URL")
+    s3_port = os.getenv("S3_PORT", "9000")
+
+    if s3_live_base_url and url.startswith(s3_live_base_url):
+        path_after_base = url[len(s3_live_base_url) :]
+    else:
+        alternative_bases = [
+            f"http://localhost:{s3_port}/",
+            f"http://127.0.0.1:{s3_port}/",
+            f"http://s3:{s3_port}/",
+        ]
+
+        matched_base = None
+        for alt_base in alternative_bases:
+            if url.startswith(alt_base):
+                matched_base = alt_base
+                break
+
+        if not matched_base:
+            port_pattern = f"://[^/]+:{s3_port}/"
+            match = re.search(port_pattern, url)
+            if match:
+                matched_base = url[: match.end()]
+            else:
+                url_parts = url.split("/")
+                if len(url_parts) >= 4 and ":" in url_parts[2]:
+                    matched_base = "/".join(url_parts[:3]) + "/"
+                else:
+                    raise ValueError(
+                        f"URL doesn't match any expected MinIO pattern: {url}"
+                    )
+
+        path_after_base = url[len(matched_base) :]
+
+    if path_after_base.startswith(f"{s3Bucket}/"):
+        return path_after_base[len(f"{s3Bucket}/") :]
+    else:
+        return path_after_base
+
+
+def upload_original_image(minioClient, object_keys, image_data):
+    """Upload the image sent by the user"""
+    put_object_bytes(minioClient, object_keys["original"], image_data, "image/jpeg")
+
+
+def download_original_image(minioClient, object_keys):
+    """Read back the image sent by the user"""
+    response = minioClient.get_object(
+        os.getenv("S3_BUCKET_INFERENCES_RESULTS"), object_keys["original"]
+    )
+    try:
+        return response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def put_object_bytes(minioClient, object_key, data, content_type):
+    """Upload bytes to the inferences bucket"""
+    minioClient.put_object(
+        os.getenv("S3_BUCKET_INFERENCES_RESULTS"),
+        object_key,
+        BytesIO(data),
+        length=len(data),
+        content_type=content_type,
+    )
+
+
+def get_stored_object_keys(object_keys, thumbnail_variants=()):
+    """Keys of every object stored for an inference, thumbnails included"""
+    stored = list(object_keys.values())
+    for width, image_format in thumbnail_variants:
+        for kind in ("original", "result"):
+            stored.append(get_thumbnail_key(object_keys[kind], width, image_format))
+    return stored
+
+
+def remove_uploaded_objects(minioClient, object_keys):
+    """Best effort removal of the objects of a failed inference"""
+    try:
+        errors = list(minioClient.remove_objects(
+            os.getenv("S3_BUCKET_INFERENCES_RESULTS"),
+            [DeleteObject(object_key) for object_key in object_keys]
+        ))
+        for error in errors:
+            logger.warning(f"Could not remove {error.object_name} of failed inference: {error.message}")
+    except Exception:
+        logger.exception(f"Error removing objects of failed inference: {object_keys}")
+
+
+def run_inference(nnClient, minioClient, image_data, model_name, object_keys,
+                  upload_original=True, thumbnail_variants=()):
+    """
+    Send the image to the NN API and store the original image, the result
+    image and the metadata in MinIO.
+    The original image uploads while the NN API runs, then the result image,
+    metadata and thumbnails upload concurrently. If any step but a thumbnail
+    fails, the objects already uploaded are removed before the error is
+    raised. Thumbnails are only logged when they fail, they are generated
+    on first request instead.
+    :param upload_original: False when the original image is already stored
+    :param thumbnail_variants: (width, format) thumbnails pre-generated for
+                               the original and result images
+    :return: The metadata returned by the NN API
+    """
+    timings = {}
+    started_at = time.monotonic()
+    uploads = {}
+    thumbnails = {}
+
+    def timed_put(stage, object_key, data, content_type):
+        stage_started_at = time.monotonic()
+        put_object_bytes(minioClient, object_key, data, content_type)
+        timings[stage] = time.monotonic() - stage_started_at
+        return object_key
+
+    def timed_thumbnail(object_key, data, width, image_format):
+        stage_started_at = time.monotonic()
+        thumbnail_key = upload_thumbnail(
+            minioClient, os.getenv("S3_BUCKET_INFERENCES_RESULTS"),
+            object_key, data, width, image_format
+        )
+        timings["thumbnails"] = timings.get("thumbnails", 0) + time.monotonic() - stage_started_at
+        return thumbnail_key
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        try:
+            if upload_original:
+                uploads["original"] = executor.submit(
+                    timed_put, "original_upload", object_keys["original"],
+                    image_data, "image/jpeg"
+                )
+
+            # Send binary image data to NN API
+            stage_started_at = time.monotonic()
+            inference_result = nnClient.generateInferenceResult(
+                image_data, model_name, object_keys["original"]
+            )
+            timings["nn_api"] = time.monotonic() - stage_started_at
+
+            # Binary result image and metadata from the NN API response
+            stage_started_at = time.monotonic()
+            result_image_data = inference_result["result_image"]
+            metadata = inference_result["metadata"]
+            metadata_json = json.dumps(metadata).encode("utf-8")
+            timings["decode"] = time.monotonic() - stage_started_at
+
+            uploads["result"] = executor.submit(
+                timed_put, "result_upload", object_keys["result"],
+                result_image_data, "image/jpeg"
+            )
+            uploads["metadata"] = executor.submit(
+                timed_put, "metadata_upload", object_keys["metadata"],
+                metadata_json, "application/json"
+            )
+            for width, image_format in thumbnail_variants:
+                for kind, data in (("original", image_data), ("result", result_image_data)):
+                    thumbnails[(kind, width, image_format)] = executor.submit(
+                        timed_thumbnail, object_keys[kind], data, width, image_format
+                    )
+
+            for upload in uploads.values():
+                upload.result()
+
+        except Exception:
+            # Wait for in-flight uploads so none is left behind after cleanup
+            uploaded = []
+            for upload in [*uploads.values(), *thumbnails.values()]:
+                try:
+                    uploaded.append(upload.result())
+                except Exception:
+                    pass
+            if uploaded:
+                remove_uploaded_objects(minioClient, uploaded)
+            raise
+
+        for (kind, width, image_format), thumbnail in thumbnails.items():
+            try:
+                thumbnail.result()
+            except Exception:
+                logger.exception(
+                    f"Error pre-generating {width}px {image_format} thumbnail "
+                    f"of {object_keys[kind]}"
+                )
+
+    timings["total"] = time.monotonic() - started_at
+    logger.info(
+        f"Inference pipeline timings for {object_keys['original']}: "
+        + ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in timings.items())
+    )
+    return metadata
+
+
+def build_inference(user_id, model_id, name, object_keys, created_on=None,
+                    image_hash=None):
+    """Build the Inference record pointing to the stored objects"""
+    return Inference(
+        userId=user_id,
+        modelId=model_id,
+        name=name,
+        baseImageUrl=get_object_url(object_keys["original"]),
+        generatedImageUrl=get_object_url(object_keys["result"]),
+        metadataUrl=get_object_url(object_keys["metadata"]),
+        createdOn=created_on or datetime.datetime.utcnow(),
+        imageHash=image_hash,
+    )
+
+
+def create_inference_record(user_id, model_id, name, object_keys, metadata,
+                            created_on=None, image_hash=None):
+    """
+    Add the inference, its detections and rollups to the session.
+    The caller is responsible for committing.
+    """
+    new_inference = build_inference(
+        user_id, model_id, name, object_keys, created_on, image_hash
+    )
+    db.session.add(new_inference)
+    record_inference_detections(new_inference, metadata)
+    return new_inference
+
+
+def create_inference_records(entries):
+    """
+    Add many inferences in a single bulk insert, along with their
+    detections and rollups. The caller is responsible for committing.
+    :param entries: list of (inference, metadata) pairs built with
+                    build_inference
+    """
+    db.session.add_all([inference for inference, _ in entries])
+    record_detections(entries)
+    return [inference for inference, _ in entries]
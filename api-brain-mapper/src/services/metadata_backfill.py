@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import click
+from concurrent.futures import ThreadPoolExecutor
+from flask.cli import with_appcontext
+from sqlalchemy import insert, update, select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+from logs.logger import logger
+from ..cloudServices.minioConnections import getMinioClient
+from ..database.dbConnection import db
+from ..models.inference import Inference
+from ..models.inference_class_count import InferenceClassCount
+from ..models.detection import Detection
+from .detection_rollup import add_to_daily_rollups
+from .detection_summary import (
+    summarize_detections,
+    build_detection_rows,
+    get_metadata_object_key,
+)
+
+
+def load_checkpoint(checkpoint_path):
+    """Get the last committed inference id, None if there is no checkpoint"""
+    if not os.path.exists(checkpoint_path):
+        return None
+    with open(checkpoint_path) as f:
+        return json.load(f).get('lastInferenceId')
+
+
+def save_checkpoint(checkpoint_path, last_inference_id, processed):
+    """Atomically save the last committed inference id"""
+    tmp_path = f"{checkpoint_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'lastInferenceId': last_inference_id, 'processed': processed}, f)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def pending_filter():
+    return (
+        Inference.totalDetections.is_(None),
+        Inference.generatedImageUrl.isnot(None),
+    )
+
+
+def count_pending_inferences():
+    return db.session.scalar(
+        select(func.count()).select_from(Inference).where(*pending_filter())
+    )
+
+
+def load_pending_inferences(after_id, limit):
+    """
+    Get the next page of inferences that still have no summary, in id
+    order, so memory doesn't grow with the number of pending inferences.
+    Only the columns needed to build the rows are loaded.
+    """
+    query = db.session.query(
+        Inference.id,
+        Inference.userId,
+        Inference.modelId,
+        Inference.createdOn,
+        Inference.generatedImageUrl
+    ).filter(*pending_filter())
+    if after_id is not None:
+        query = query.filter(Inference.id > after_id)
+    return query.order_by(Inference.id).limit(limit).all()
+
+
+def select_pending_ids(inference_ids):
+    """Ids that still exist and have no summary, e.g. after a conflict"""
+    return set(db.session.scalars(
+        select(Inference.id).where(
+            Inference.id.in_(inference_ids), *pending_filter()
+        )
+    ))
+
+
+def fetch_metadata(minioClient, bucket, object_key):
+    """Download and parse one metadata.json, runs in the worker threads"""
+    response = minioClient.get_object(bucket, object_key)
+    try:
+        return json.loads(response.read().decode('utf-8'))
+    finally:
+        response.close()
+        response.release_conn()
+
+
+def write_batch(batch):
+    """
+    Bulk write the summaries, detections and daily rollups of a batch of
+    (inference row, metadata) pairs in a single transaction.
+    """
+    summary_params = []
+    class_count_rows = []
+    detection_rows = []
+    rollup_entries = []
+
+    for inference, metadata in batch:
+        detections = metadata.get('detections', [])
+        summary = summarize_detections(detections)
+
+        summary_params.append({
+            'id': inference.id,
+            'totalDetections': summary['totalDetections'],
+            'meanConfidence': summary['meanConfidence'],
+            'minConfidence': summary['minConfidence'],
+            'maxConfidence': summary['maxConfidence'],
+        })
+        class_count_rows.extend(
+            {'inferenceId': inference.id, 'classId': class_id, 'count': count}
+            for class_id, count in summary['classCounts'].items()
+        )
+        detection_rows.extend(build_detection_rows(inference, detections))
+        rollup_entries.append((inference, summary))
+
+    # executemany for every table, one round trip per page of rows
+    db.session.execute(update(Inference), summary_params)
+    if class_count_rows:
+        db.session.execute(insert(InferenceClassCount), class_count_rows)
+    if detection_rows:
+        db.session.execute(insert(Detection), detection_rows)
+    add_to_daily_rollups(rollup_entries)
+    db.session.commit()
+
+    return len(detection_rows)
+
+
+def save_batch(batch, attempts=3):
+    """
+    Write a batch, leaving out the inferences that conflict with a
+    concurrent change: summarized by a dashboard load meanwhile (duplicate
+    class counts) or deleted (foreign key violation). The batch is retried
+    with the inferences still pending, and skipped after `attempts`.
+    :return: Number of detections saved
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return write_batch(batch)
+        except (IntegrityError, StaleDataError) as e:
+            db.session.rollback()
+            pending_ids = select_pending_ids([inference.id for inference, _ in batch])
+            db.session.rollback()  # Don't keep the read transaction open
+            logger.warning(
+                f"Conflict saving batch of {len(batch)} inferences (attempt "
+                f"{attempt}), {len(batch) - len(pending_ids)} no longer pending: "
+                f"{type(e).__name__}"
+            )
+            batch = [(inference, metadata) for inference, metadata in batch
+                     if inference.id in pending_ids]
+            if not batch:
+                return 0
+        except Exception:
+            db.session.rollback()
+            raise
+
+    logger.error(
+        f"Skipped batch of inferences {batch[0][0].id}-{batch[-1][0].id} "
+        f"after {attempts} conflicting attempts"
+    )
+    return 0
+
+
+def backfill_detections(workers=8, batch_size=500, checkpoint_path=None):
+    """
+    Ingest the metadata.json objects of inferences without a summary.
+    Inferences are paged in id order and committed in batches, so the
+    last id of a committed batch is a valid point to resume from.
+    """
+    minioClient = getMinioClient()
+    s3Bucket = os.getenv("S3_BUCKET_INFERENCES_RESULTS")
+
+    last_id = load_checkpoint(checkpoint_path) if checkpoint_path else None
+    if last_id is not None:
+        logger.info(f"Resuming detections backfill after inference {last_id}")
+
+    logger.info(f"Found {count_pending_inferences()} inferences without detection summary")
+    db.session.rollback()
+
+    processed = 0
+    detections = 0
+    failed = 0
+    started_at = time.monotonic()
+
+    def run_batch(executor, rows):
+        nonlocal processed, detections, failed
+
+        futures = []
+        for row in rows:
+            key = get_metadata_object_key(row)
+            if key:
+                futures.append(
+                    (row, key, executor.submit(fetch_metadata, minioClient, s3Bucket, key))
+                )
+
+        batch = []
+        for row, key, future in futures:
+            try:
+                batch.append((row, future.result()))
+            except Exception as e:
+                failed += 1
+                logger.warning(f"Could not read {key}: {str(e)}")
+
+        if batch:
+            detections += save_batch(batch)
+        processed += len(rows)
+
+        if checkpoint_path:
+            save_checkpoint(checkpoint_path, rows[-1].id, processed)
+
+        elapsed = time.monotonic() - started_at
+        logger.info(
+            f"Backfilled {processed} objects ({detections} detections, "
+            f"{failed} failed) - {processed / elapsed:.1f} objects/sec"
+        )
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            rows = load_pending_inferences(last_id, batch_size)
+            db.session.rollback()  # No transaction open while downloading
+            if not rows:
+                break
+            run_batch(executor, rows)
+            last_id = rows[-1].id
+
+    elapsed = time.monotonic() - started_at
+    logger.info(
+        f"Detections backfill completed: {processed} objects in {elapsed:.1f}s "
+        f"({processed / elapsed if elapsed else 0:.1f} objects/sec), "
+        f"{detections} detections, {failed} failed"
+    )
+    return processed
+
+
+@click.command("backfill-detections")
+@click.option("--workers", default=8, show_default=True,
+              help="Number of parallel MinIO downloads.")
+@click.option("--batch-size", default=500, show_default=True,
+              help="Inferences committed per transaction.")
+@click.option("--checkpoint", "checkpoint_path",
+              default="detections_backfill.checkpoint.json", show_default=True,
+              help="File used to resume an interrupted run.")
+@with_appcontext
+def backfill_detections_command(workers, batch_size, checkpoint_path):
+    """Ingest existing metadata.json objects into the detections tables."""
+    backfill_detections(workers=workers, batch_size=batch_size,
+                        checkpoint_path=checkpoint_path)
@@ -0,0 +1,195 @@
+import os
+import time
+import signal
+import datetime
+import click
+from flask.cli import with_appcontext
+from minio.deleteobjects import DeleteObject
+from logs.logger import logger
+from ..cloudServices.minioConnections import getMinioClient
+from ..database.dbConnection import db
+from ..models.inference_tombstone import InferenceTombstone
+from .detection_rollup import remove_from_daily_rollups
+from .inference_pipeline import get_object_key_from_url
+
+# Objects per remove_objects call, the S3 limit of a DeleteObjects request
+REMOVE_BATCH_SIZE = 1000
+
+
+def get_inference_prefix(inference):
+    """MinIO folder holding every object of an inference, e.g. "1/<folder>/" """
+    object_key = get_object_key_from_url(inference.baseImageUrl)
+    folder_name = object_key.split("/")[-2]
+    return f"{inference.userId}/{folder_name}/"
+
+
+def tombstone_inferences(inferences):
+    """
+    Delete inferences from the DB right away, leaving a tombstone per
+    inference so the storage reaper removes their objects later.
+    The caller is responsible for committing the session.
+    """
+    now = datetime.datetime.utcnow()
+    for inference in inferences:
+        db.session.add(InferenceTombstone(
+            userId=inference.userId,
+            inferenceId=inference.id,
+            prefix=get_inference_prefix(inference),
+            attempts=0,
+            createdOn=now,
+            nextAttemptOn=now,
+        ))
+        remove_from_daily_rollups(inference)
+        db.session.delete(inference)
+
+
+def claim_tombstones(batch_size, lease_seconds):
+    """
+    Claim the tombstones due for removal. Their next attempt is pushed
+    back by the lease, so other reapers skip them while they are processed,
+    and they are retried if this reaper dies.
+    """
+    now = datetime.datetime.utcnow()
+    tombstones = InferenceTombstone.query.filter(
+        InferenceTombstone.nextAttemptOn <= now
+    ).order_by(InferenceTombstone.nextAttemptOn).limit(batch_size).with_for_update(
+        skip_locked=True
+    ).all()
+
+    for tombstone in tombstones:
+        tombstone.attempts += 1
+        tombstone.nextAttemptOn = now + datetime.timedelta(seconds=lease_seconds)
+    db.session.commit()
+    return tombstones
+
+
+def remove_prefixes(minioClient, bucket, prefixes):
+    """
+    Remove every object under the given folders, with one remove_objects
+    call per REMOVE_BATCH_SIZE objects across all of them.
+    :return: {prefix: error message} of the folders not fully removed
+    """
+    failed = {}
+    object_names = []
+    for prefix in prefixes:
+        try:
+            object_names.extend(
+                obj.object_name
+                for obj in minioClient.list_objects(bucket, prefix=prefix, recursive=True)
+            )
+        except Exception as e:
+            failed[prefix] = f"Error listing objects: {str(e)}"
+
+    def get_prefix(object_name):
+        return "/".join(object_name.split("/")[:2]) + "/"
+
+    for start in range(0, len(object_names), REMOVE_BATCH_SIZE):
+        batch = object_names[start:start + REMOVE_BATCH_SIZE]
+        try:
+            # Lazy: the request is sent while the errors are read
+            for error in minioClient.remove_objects(
+                bucket, [DeleteObject(name) for name in batch]
+            ):
+                failed[get_prefix(error.object_name)] = f"{error.code} - {error.message}"
+        except Exception as e:
+            for name in batch:
+                failed[get_prefix(name)] = str(e)
+
+    return failed
+
+
+def reap_tombstones(minioClient, bucket, tombstones, max_attempts, retry_backoff):
+    """
+    Remove the objects of claimed tombstones. Removed tombstones are
+    deleted, failed ones are retried with an exponential backoff and kept
+    with their error after max_attempts.
+    :return: number of tombstones removed
+    """
+    failed = remove_prefixes(minioClient, bucket, {t.prefix for t in tombstones})
+
+    now = datetime.datetime.utcnow()
+    removed = 0
+    for tombstone in tombstones:
+        error = failed.get(tombstone.prefix)
+        if error is None:
+            db.session.delete(tombstone)
+            removed += 1
+            continue
+
+        tombstone.errorMessage = error[:500]
+        if tombstone.attempts >= max_attempts:
+            tombstone.nextAttemptOn = None
+            logger.error(
+                f"Giving up removing {tombstone.prefix} of inference "
+                f"{tombstone.inferenceId} after {tombstone.attempts} attempts: {error}"
+            )
+        else:
+            delay = retry_backoff * 2 ** (tombstone.attempts - 1)
+            tombstone.nextAttemptOn = now + datetime.timedelta(seconds=delay)
+            logger.warning(
+                f"Removing {tombstone.prefix} of inference {tombstone.inferenceId} "
+                f"will be retried in {delay}s: {error}"
+            )
+    db.session.commit()
+    return removed
+
+
+def run_storage_reaper(poll_interval=5.0, batch_size=100, lease_seconds=300,
+                       max_attempts=5, retry_backoff=30.0):
+    """Remove the objects of deleted inferences until SIGTERM or SIGINT"""
+    minioClient = getMinioClient()
+    bucket = os.getenv("S3_BUCKET_INFERENCES_RESULTS")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        logger.info("Storage reaper stopping after the current batch")
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info(f"Storage reaper {os.getpid()} started")
+    while not stopping:
+        try:
+            tombstones = claim_tombstones(batch_size, lease_seconds)
+            if tombstones:
+                removed = reap_tombstones(
+                    minioClient, bucket, tombstones, max_attempts, retry_backoff
+                )
+                logger.info(
+                    f"Storage reaper removed {removed}/{len(tombstones)} inference folders"
+                )
+        except Exception:
+            logger.exception("Error reaping inference tombstones")
+            db.session.rollback()
+            tombstones = None
+        finally:
+            db.session.remove()
+
+        # Keep going while there is a backlog
+        if not tombstones or len(tombstones) < batch_size:
+            time.sleep(poll_interval)
+
+
+@click.command("storage-reaper")
+@click.option("--poll-interval", default=5.0, show_default=True,
+              help="Seconds to wait when there is nothing to remove.")
+@click.option("--batch-size", default=100, show_default=True,
+              help="Deleted inferences removed per batch.")
+@click.option("--lease", "lease_seconds", default=300, show_default=True,
+              help="Seconds before a batch of a dead reaper is retried.")
+@click.option("--max-attempts", default=5, show_default=True,
+              help="Attempts before giving up on a deleted inference.")
+@click.option("--retry-backoff", default=30.0, show_default=True,
+              help="Seconds before the first retry, doubled on every attempt.")
+@with_appcontext
+def storage_reaper_command(poll_interval, batch_size, lease_seconds,
+                           max_attempts, retry_backoff):
+    """Remove from MinIO the objects of deleted inferences."""
+    run_storage_reaper(poll_interval=poll_interval,
+                       batch_size=batch_size,
+                       lease_seconds=lease_seconds,
+                       max_attempts=max_attempts,
+                       retry_backoff=retry_backoff)
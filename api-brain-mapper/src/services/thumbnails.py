@@ -0,0 +1,149 @@
+import os
+from io import BytesIO
+from PIL import Image
+from flask import current_app
+from minio.error import S3Error
+from logs.logger import logger
+
+THUMBNAIL_FORMATS = {
+    "jpeg": ("jpg", "image/jpeg"),
+    "webp": ("webp", "image/webp"),
+}
+
+
+def parse_thumbnail_variants(value):
+    """
+    Parse a "width:format" comma separated list, e.g. "320:webp,640:jpeg"
+    :return: list of (width, format)
+    """
+    variants = []
+    for variant in (value or "").split(","):
+        if not variant.strip():
+            continue
+        width, _, image_format = variant.strip().partition(":")
+        variants.append((int(width), image_format or "jpeg"))
+    return variants
+
+
+def get_pregenerated_variants():
+    """Thumbnails generated along with every inference"""
+    return parse_thumbnail_variants(
+        current_app.config.get("INFERENCE_THUMBNAIL_PREGENERATE")
+    )
+
+
+def get_thumbnail_variant(width, image_format):
+    """
+    Validate the ?w= and ?format= of a thumbnail request. Widths snap to the
+    next allowed one (INFERENCE_THUMBNAIL_WIDTHS), so clients can't fill the
+    bucket with a derivative per pixel.
+    :return: (width, format)
+    Raises ValueError if the parameters are invalid.
+    """
+    image_format = (image_format or "jpeg").lower()
+    if image_format == "jpg":
+        image_format = "jpeg"
+    if image_format not in THUMBNAIL_FORMATS:
+        raise ValueError("Invalid format. Must be 'jpeg' or 'webp'")
+
+    allowed_widths = sorted(
+        int(w) for w in current_app.config.get(
+            "INFERENCE_THUMBNAIL_WIDTHS", "160,320,640,1280"
+        ).split(",")
+    )
+    if width is None:
+        return allowed_widths[-1], image_format
+
+    try:
+        width = int(width)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid width")
+    if width <= 0:
+        raise ValueError("Invalid width")
+
+    width = next((w for w in allowed_widths if w >= width), allowed_widths[-1])
+    return width, image_format
+
+
+def get_thumbnail_content_type(image_format):
+    _, content_type = THUMBNAIL_FORMATS[image_format]
+    return content_type
+
+
+def get_thumbnail_key(object_key, width, image_format):
+    """
+    Key of a derivative image, stored next to its source in the inference
+    folder so it is deleted along with it.
+    e.g. 1/<folder>/original_img.jpg -> 1/<folder>/original_img_w320.webp
+    """
+    extension, _ = THUMBNAIL_FORMATS[image_format]
+    base, _ = os.path.splitext(object_key)
+    return f"{base}_w{width}.{extension}"
+
+
+def render_thumbnail(image_data, width, image_format):
+    """
+    Resize an image to the given width, keeping its aspect ratio. Images
+    narrower than the width are only re-encoded.
+    JPEG sources are decoded at a reduced scale with draft(), which is
+    much faster than decoding the full image and resizing it.
+    """
+    image = Image.open(BytesIO(image_data))
+    image.draft("RGB", (width, width * image.height // image.width))
+    image = image.convert("RGB")
+
+    if image.width > width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.Resampling.LANCZOS)
+
+    output = BytesIO()
+    if image_format == "webp":
+        image.save(output, format="WEBP", quality=80, method=4)
+    else:
+        image.save(output, format="JPEG", quality=80, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def upload_thumbnail(minioClient, bucket, object_key, image_data, width, image_format):
+    """Render and store a derivative of an image, returns its key"""
+    thumbnail_key = get_thumbnail_key(object_key, width, image_format)
+    _, content_type = THUMBNAIL_FORMATS[image_format]
+    thumbnail_data = render_thumbnail(image_data, width, image_format)
+    minioClient.put_object(
+        bucket,
+        thumbnail_key,
+        BytesIO(thumbnail_data),
+        length=len(thumbnail_data),
+        content_type=content_type,
+    )
+    return thumbnail_key
+
+
+def create_thumbnail(minioClient, bucket, object_key, width, image_format):
+    """Generate a derivative image from its source stored in MinIO"""
+    response = minioClient.get_object(bucket, object_key)
+    try:
+        image_data = response.read()
+    finally:
+        response.close()
+        response.release_conn()
+
+    logger.info(
+        f"Generating thumbnail {get_thumbnail_key(object_key, width, image_format)}"
+    )
+    return upload_thumbnail(minioClient, bucket, object_key, image_data, width, image_format)
+
+
+def ensure_thumbnail(minioClient, bucket, object_key, width, image_format):
+    """
+    Get the key of a derivative image, generating it from its source the
+    first time it is requested.
+    """
+    thumbnail_key = get_thumbnail_key(object_key, width, image_format)
+    try:
+        minioClient.stat_object(bucket, thumbnail_key)
+        return thumbnail_key
+    except S3Error as e:
+        if e.code != "NoSuchKey":
+            raise
+    return create_thumbnail(minioClient, bucket, object_key, width, image_format)
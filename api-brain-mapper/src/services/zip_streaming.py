@@ -0,0 +1,70 @@
+import zipfile
+
+# Already compressed formats, deflating them only costs CPU
+STORED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".zip")
+
+
+class _ZipOutput:
+    """
+    Write-only file handed to ZipFile. It has no seek(), so ZipFile writes
+    each entry once, sizes and CRC going in a data descriptor after it.
+    The bytes written are collected until the stream takes them.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks = self.chunks
+        self.chunks = []
+        return chunks
+
+
+class ZipEntry:
+    """
+    A file of a streamed ZIP.
+    :param chunks: Iterable of the bytes of the file, only iterated when the
+                   entry is written
+    :param size: Size in bytes if known, lets ZipFile skip ZIP64 headers
+    """
+
+    def __init__(self, name, chunks, date_time, size=None):
+        self.name = name
+        self.chunks = chunks
+        self.date_time = date_time
+        self.size = size
+
+
+def stream_zip(entries):
+    """
+    Generator of the bytes of a ZIP archive, built while it is sent. Only
+    the chunk being written is in memory and nothing is written to disk.
+    Images are STOREd and every other file is deflated.
+    :param entries: Iterable of ZipEntry
+    """
+    output = _ZipOutput()
+    with zipfile.ZipFile(output, "w") as zip_file:
+        for entry in entries:
+            info = zipfile.ZipInfo(entry.name, date_time=entry.date_time)
+            if entry.name.lower().endswith(STORED_EXTENSIONS):
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+            if entry.size is not None:
+                info.file_size = entry.size
+
+            with zip_file.open(info, "w") as zip_entry:
+                for chunk in entry.chunks:
+                    zip_entry.write(chunk)
+                    yield from output.drain()
+            yield from output.drain()
+
+    # Central directory
+    yield from output.drain()
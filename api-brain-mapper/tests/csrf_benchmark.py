@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from flask import Flask
+from src.security.csrf_protection import CSRFProtection
+
+"""
+Time the validation of CSRF tokens: legacy PBKDF2 signatures, HMAC-SHA256
+signatures, and tokens already verified by the worker.
+Run from api-brain-mapper/:
+
+python tests/csrf_benchmark.py --tokens 200 --repeat 5
+"""
+
+
+def bench(name, csrf, tokens, repeat):
+    started_at = time.perf_counter()
+    for _ in range(repeat):
+        for token in tokens:
+            assert csrf._is_valid_csrf_token(token), token
+    elapsed = time.perf_counter() - started_at
+    count = len(tokens) * repeat
+    print(f"{name:<28} {count:>7} validations  {elapsed * 1e6 / count:>10.1f} us/token")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=200, help="Distinct tokens")
+    parser.add_argument("--repeat", type=int, default=5, help="Validations per token")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config["CSRF_SECRET_KEY"] = "benchmark-secret-key"
+    app.config["CSRF_TOKEN_TIMEOUT"] = 3600
+    app.config["CSRF_ACCEPT_LEGACY_TOKENS"] = True
+
+    with app.app_context():
+        # Only the validation is measured, no before_request handler needed
+        csrf = CSRFProtection()
+
+        # Legacy tokens are only accepted if issued before the worker started
+        timestamp_str = str(csrf._started_at - 1)
+        session_ids = [f"{i:032x}" for i in range(args.tokens)]
+        legacy_tokens = [
+            f"{timestamp_str}.{sid}.{csrf._generate_legacy_csrf_signature(timestamp_str, sid)}"
+            for sid in session_ids
+        ]
+        tokens = [csrf.generate_csrf_token(session_id=sid) for sid in session_ids]
+
+        # Without the verified tokens cache: every validation checks the signature
+        app.config["CSRF_VERIFIED_CACHE_SIZE"] = 0
+        bench("legacy PBKDF2", csrf, legacy_tokens, 1)
+        bench("HMAC-SHA256", csrf, tokens, args.repeat)
+
+        app.config["CSRF_VERIFIED_CACHE_SIZE"] = args.tokens * 2
+        bench("HMAC-SHA256, first use", csrf, tokens, 1)
+        bench("HMAC-SHA256, verified", csrf, tokens, args.repeat)
+        bench("legacy PBKDF2, first use", csrf, legacy_tokens, 1)
+        bench("legacy PBKDF2, verified", csrf, legacy_tokens, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
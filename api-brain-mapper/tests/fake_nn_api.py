@@ -0,0 +1,74 @@
+import time
+import json
+import random
+import argparse
+from flask import Flask, Response, request, jsonify
+
+"""
+Fake NN API to try the replica balancing of NnAPIClient locally.
+Start a few replicas with different latencies and failure rates:
+
+    python tests/fake_nn_api.py --port 8081 --latency 0.2
+    python tests/fake_nn_api.py --port 8082 --latency 0.8
+    python tests/fake_nn_api.py --port 8083 --fail-rate 1
+
+and point the API to all of them:
+
+    NN_API_HOST=http://localhost:8081,http://localhost:8082,http://localhost:8083
+
+Inferences answer multipart/mixed with a fake detection and the uploaded
+image as the result image. Tokens are not verified.
+"""
+
+app = Flask(__name__)
+settings = {"latency": 0.0, "fail_rate": 0.0}
+BOUNDARY = "fake-nn-api-boundary"
+
+
+def simulate_load():
+    time.sleep(settings["latency"] * random.uniform(0.8, 1.2))
+    return random.random() < settings["fail_rate"]
+
+
+@app.route("/models", methods=["GET"])
+def models():
+    if simulate_load():
+        return jsonify({"error": "Fake failure"}), 503
+    return jsonify({"models": [{"name": "fake_model"}]})
+
+
+@app.route("/inferencia", methods=["POST"])
+def inferencia():
+    if simulate_load():
+        return jsonify({"error": "Fake failure"}), 503
+
+    image = request.files["image"].read()
+    metadata = {
+        "model_name": request.form.get("model_name"),
+        "detections": [
+            {"class_id": 0, "confidence": 0.9, "bbox": [10, 10, 50, 50]}
+        ],
+    }
+
+    body = b"".join([
+        f"--{BOUNDARY}\r\nContent-Type: application/json\r\n\r\n".encode(),
+        json.dumps(metadata).encode(),
+        f"\r\n--{BOUNDARY}\r\nContent-Type: image/jpeg\r\n\r\n".encode(),
+        image,
+        f"\r\n--{BOUNDARY}--\r\n".encode(),
+    ])
+    return Response(body, content_type=f"multipart/mixed; boundary={BOUNDARY}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds per request, +-20%%")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+
+    settings["latency"] = args.latency
+    settings["fail_rate"] = args.fail_rate
+    app.run(port=args.port, threaded=True)
@@ -0,0 +1,103 @@
+import time
+import argparse
+import threading
+import requests
+import urllib3
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+Latency of an unrelated endpoint while a burst of logins hashes passwords.
+Run it against a gunicorn gevent server (bcrypt only goes to the threadpool
+under gevent), in development mode so logins are not rate limited:
+
+python tests/login_load.py --url https://devserver.local/api --email <email> --passwd <password>
+
+Compare the p99 of the probe with and without the burst, and with
+PASSWORD_HASH_THREADS=0 vs the default.
+Queue depth during the burst: GET /admin/password-hashing/metrics
+"""
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000
+
+
+def probe(url, seconds=None, until=None):
+    """Time GET requests to the probe endpoint for the given seconds or until the event is set"""
+    latencies = []
+    end = time.monotonic() + seconds if seconds is not None else None
+    with requests.Session() as session:
+        session.verify = False  # Ignore SSL verification
+        while (end is None or time.monotonic() < end) and not (until and until.is_set()):
+            started_at = time.monotonic()
+            session.get(url)
+            latencies.append(time.monotonic() - started_at)
+    return latencies
+
+
+def login_burst(url, email, passwd, logins, concurrency):
+    local = threading.local()
+
+    def login(_):
+        # One keep-alive session per thread
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.session.verify = False
+        return local.session.post(url, json={"email": email, "passwd": passwd}).status_code
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        return list(executor.map(login, range(logins)))
+
+
+def report(name, latencies):
+    print(
+        f"{name:<14} {len(latencies):>6} requests  "
+        f"p50 {percentile(latencies, 50):8.1f} ms  "
+        f"p99 {percentile(latencies, 99):8.1f} ms  "
+        f"max {max(latencies) * 1000:8.1f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="https://devserver.local/api")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--passwd", required=True)
+    parser.add_argument("--probe-path", default="/auth/isLoggedIn",
+                        help="Unrelated endpoint timed during the burst")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=5.0,
+                        help="Duration of the baseline probe")
+    args = parser.parse_args()
+
+    probe_url = f"{args.url}{args.probe_path}"
+    report("baseline", probe(probe_url, seconds=args.seconds))
+
+    burst_done = threading.Event()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        during = executor.submit(probe, probe_url, until=burst_done)
+        started_at = time.monotonic()
+        try:
+            statuses = login_burst(
+                f"{args.url}/auth/login", args.email, args.passwd,
+                args.logins, args.concurrency,
+            )
+        finally:
+            burst_done.set()
+        elapsed = time.monotonic() - started_at
+        latencies = during.result()
+
+    report("during burst", latencies)
+    print(
+        f"{args.logins} logins in {elapsed:.1f}s "
+        f"({args.logins / elapsed:.1f}/s), "
+        f"{statuses.count(200)} succeeded"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import os
+import sys
+import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+from flask import Flask
+from src.database.dbConnection import db
+from src.models.user import User
+from src.models.role import Role
+from src.models.model import Model
+from src.models.inference import Inference  # noqa: F401
+from src.models.inference_class_count import InferenceClassCount  # noqa: F401
+from src.models.detection import Detection  # noqa: F401
+from src.models.inference_job import InferenceJob
+from src.models.user_session import UserSession  # noqa: F401
+from src.services.inference_jobs import (
+    claim_next_job,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_FAILED,
+)
+
+"""
+Claiming of inference jobs, on an in-memory SQLite DB (FOR UPDATE SKIP
+LOCKED is left out by SQLAlchemy there). Run from api-brain-mapper/:
+
+python -m pytest tests/test_inference_jobs.py
+"""
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add(Role(id=1, name="AI_USER"))
+        db.session.add(User(id=1, name="a", lastName="b", email="a@b.com",
+                            password="x", roleId=1))
+        db.session.add(Model(id=1, name="m", version="1", modelType="y",
+                             createdOn=datetime.datetime.utcnow()))
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+
+def add_job(status, attempts, heartbeat_age=None):
+    now = datetime.datetime.utcnow()
+    heartbeat_on = now - datetime.timedelta(seconds=heartbeat_age) if heartbeat_age else None
+    job = InferenceJob(
+        userId=1, modelId=1, name="n", folderName="folder", status=status,
+        attempts=attempts, createdOn=now, startedOn=heartbeat_on,
+        heartbeatOn=heartbeat_on, claimToken="lost" if heartbeat_on else None,
+    )
+    db.session.add(job)
+    db.session.commit()
+    return job.id
+
+
+def test_claims_queued_job(app):
+    job_id = add_job(JOB_QUEUED, 0)
+
+    job, claim_token = claim_next_job(300, max_attempts=3)
+
+    assert job.id == job_id
+    assert job.status == JOB_RUNNING
+    assert job.attempts == 1
+    assert job.claimToken == claim_token
+
+
+def test_reclaims_stale_job_with_attempts_left(app):
+    job_id = add_job(JOB_RUNNING, 1, heartbeat_age=600)
+
+    job, claim_token = claim_next_job(300, max_attempts=3)
+
+    assert job.id == job_id
+    assert job.attempts == 2
+    assert claim_token != "lost"
+
+
+def test_keeps_running_job_with_live_lease(app):
+    add_job(JOB_RUNNING, 1, heartbeat_age=10)
+
+    assert claim_next_job(300, max_attempts=3) == (None, None)
+
+
+def test_fails_stale_job_out_of_attempts(app):
+    # e.g. its worker was OOM killed on every attempt
+    poison_id = add_job(JOB_RUNNING, 3, heartbeat_age=600)
+    next_id = add_job(JOB_QUEUED, 0)
+
+    job, _ = claim_next_job(300, max_attempts=3)
+
+    assert job.id == next_id
+    poison = db.session.get(InferenceJob, poison_id)
+    assert poison.status == JOB_FAILED
+    assert poison.attempts == 3
+    assert poison.claimToken is None
+    assert poison.finishedOn is not None
+    assert "lost the lease" in poison.errorMessage